@@ -29,6 +29,7 @@ from multiprocessing import Process, Queue
 
 import numpy as np
 from data_layer.minibatch import get_minibatch
+from utils.cpu_budget import available_cpus, pin_process, format_cpus
 from wpal_net.config import cfg
 
 import caffe
@@ -137,7 +138,12 @@ class BlobFetcher(Process):
         return minibatch_inds
 
     def run(self):
-        print 'BlobFetcher started'
+        if cfg.TRAIN.FETCHER_CPUS > 0:
+            cpus = available_cpus()[-cfg.TRAIN.FETCHER_CPUS:]
+            pin_process(cpus)
+            print 'BlobFetcher started on CPUs {}'.format(format_cpus(cpus))
+        else:
+            print 'BlobFetcher started'
         while True:
             minibatch_inds = self._get_next_minibatch_inds()
             minibatch_img_paths = \
@@ -0,0 +1,136 @@
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Share the CPU cores of a node among worker processes. Each worker is
+pinned to a set of cores of its own, and limits its BLAS and OpenMP threads
+to the size of that set, so that workers do not oversubscribe the cores.
+"""
+
+import ctypes
+import ctypes.util
+import os
+from multiprocessing import cpu_count
+
+import cv2
+
+_CPU_SETSIZE = 1024
+_BITS = 8 * ctypes.sizeof(ctypes.c_ulong)
+_cpu_set_t = ctypes.c_ulong * (_CPU_SETSIZE / _BITS)
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _libc.sched_getaffinity
+    _libc.sched_setaffinity
+except (OSError, AttributeError):
+    # Not on Linux, so processes cannot be pinned.
+    _libc = None
+
+
+def set_num_threads(num_threads):
+    """Limit the threads used by BLAS, OpenMP and OpenCV in this process.
+    Takes effect on BLAS only if called before Caffe is loaded.
+    """
+    for var in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+        os.environ[var] = str(num_threads)
+    cv2.setNumThreads(num_threads)
+
+
+def available_cpus():
+    """Return the cores this process may run on, which may be fewer than the
+    cores of the node when run under taskset or in a container.
+    """
+    mask = _cpu_set_t()
+    if _libc is None or _libc.sched_getaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        return range(cpu_count())
+    return [i for i in xrange(_CPU_SETSIZE) if mask[i / _BITS] >> (i % _BITS) & 1]
+
+
+def set_affinity(cpus):
+    """Pin the calling thread, and the threads it starts from now on, to the
+    given cores. Returns whether it was pinned.
+    """
+    if _libc is None:
+        return False
+    mask = _cpu_set_t()
+    for i in cpus:
+        mask[i / _BITS] |= 1 << (i % _BITS)
+    if _libc.sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return True
+
+
+def assign_cpus(num_workers, num_threads=None, cpus=None):
+    """Split cores into a set for every worker. The sets are disjoint unless
+    more threads are asked for than there are cores, in which case the cores
+    are dealt out in turn and shared.
+    Arguments:
+        num_workers (int):  number of workers.
+        num_threads (int):  number of cores of each worker. Defaults to
+                            sharing the cores evenly.
+        cpus (list):        cores to split. Defaults to available_cpus().
+    Returns:
+        A list holding the cores of each worker.
+    """
+    if cpus is None:
+        cpus = available_cpus()
+    if num_threads is None:
+        num_threads = max(1, len(cpus) / num_workers)
+    return [[cpus[(k * num_threads + i) % len(cpus)] for i in xrange(num_threads)]
+            for k in xrange(num_workers)]
+
+
+def pin_process(cpus, num_threads=None):
+    """Pin a worker process to its cores and limit its threads accordingly.
+    Call it first thing in the worker, before it loads Caffe or starts any
+    thread.
+    Arguments:
+        cpus (list):        cores of the worker.
+        num_threads (int):  number of BLAS and OpenMP threads. Defaults to
+                            the number of cores.
+    """
+    set_affinity(cpus)
+    set_num_threads(num_threads if num_threads is not None else len(cpus))
+
+
+def format_cpus(cpus):
+    """Format cores compactly, e.g. [0, 1, 2, 3, 8] as 0-3,8."""
+    cpus = sorted(set(cpus))
+    spans = []
+    for i in cpus:
+        if spans and spans[-1][1] == i - 1:
+            spans[-1][1] = i
+        else:
+            spans.append([i, i])
+    return ','.join(str(a) if a == b else '{}-{}'.format(a, b) for a, b in spans)
+
+
+def report_cpus(assignment, names=None):
+    """Print the cores assigned to every worker, and warn if any is shared."""
+    if names is None:
+        names = ['worker {}'.format(k) for k in xrange(len(assignment))]
+    for name, cpus in zip(names, assignment):
+        print '{}: CPUs {} ({} threads)'.format(name, format_cpus(cpus), len(cpus))
+    num_used = sum(len(set(cpus)) for cpus in assignment)
+    if num_used > len(set(i for cpus in assignment for i in cpus)):
+        print 'Warning: CPUs are shared among workers, which may slow them down!'
+    if _libc is None:
+        print 'Warning: cannot pin processes on this system, CPUs are not assigned!'
@@ -0,0 +1,130 @@
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""On-disk store of network outputs (predictions, scores and heat maps).
+Arrays are kept as float16 in chunk files, which are memory-mapped when
+read, with an index of the offset and shape of each array of each image.
+"""
+
+import cPickle
+import os
+import os.path as osp
+
+import numpy as np
+
+_INDEX_FILE = 'index.pkl'
+
+
+def _chunk_path(store_dir, chunk_ind):
+    return osp.join(store_dir, 'chunk_{:05d}.bin'.format(chunk_ind))
+
+
+class FeatureWriter(object):
+    """Write network outputs of images into a feature store."""
+
+    def __init__(self, store_dir, chunk_bytes=1 << 30):
+        self._store_dir = store_dir
+        self._chunk_bytes = chunk_bytes
+        if not osp.exists(store_dir):
+            os.makedirs(store_dir)
+
+        self._index = {}
+        self._chunk_ind = -1
+        self._chunk_file = None
+        self._offset = 0
+        self._new_chunk()
+
+    def _new_chunk(self):
+        if self._chunk_file is not None:
+            self._chunk_file.close()
+        self._chunk_ind += 1
+        self._chunk_file = open(_chunk_path(self._store_dir, self._chunk_ind), 'wb')
+        self._offset = 0
+
+    def add(self, img_id, img_scale=None, **arrays):
+        """Store arrays of an image, e.g. add(i, pred=pred, score=score)."""
+        if self._offset * 2 >= self._chunk_bytes:
+            self._new_chunk()
+
+        entry = {'chunk': self._chunk_ind, 'img_scale': img_scale, 'arrays': {}}
+        for name, arr in arrays.iteritems():
+            if arr is None:
+                continue
+            arr = np.ascontiguousarray(arr, dtype=np.float16)
+            self._chunk_file.write(arr.tostring())
+            entry['arrays'][name] = (self._offset, arr.shape)
+            self._offset += arr.size
+        self._index[img_id] = entry
+
+    def close(self):
+        """Flush the last chunk and write the index."""
+        self._chunk_file.close()
+        with open(osp.join(self._store_dir, _INDEX_FILE), 'wb') as f:
+            cPickle.dump(self._index, f, cPickle.HIGHEST_PROTOCOL)
+
+
+class FeatureStore(object):
+    """Read network outputs of images from a feature store."""
+
+    def __init__(self, store_dir):
+        self._store_dir = store_dir
+        with open(osp.join(store_dir, _INDEX_FILE), 'rb') as f:
+            self._index = cPickle.load(f)
+        self._chunks = {}
+
+    def __contains__(self, img_id):
+        return img_id in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def ids(self):
+        return self._index.keys()
+
+    def _chunk(self, chunk_ind):
+        if chunk_ind not in self._chunks:
+            self._chunks[chunk_ind] = np.memmap(_chunk_path(self._store_dir, chunk_ind),
+                                                dtype=np.float16, mode='r')
+        return self._chunks[chunk_ind]
+
+    def get(self, img_id, name):
+        """Return a read-only float16 view of an array of an image, or None if
+        it is not stored.
+        """
+        entry = self._index[img_id]
+        if name not in entry['arrays']:
+            return None
+        offset, shape = entry['arrays'][name]
+        size = int(np.prod(shape))
+        return self._chunk(entry['chunk'])[offset:offset + size].reshape(shape)
+
+    def img_scale(self, img_id):
+        return self._index[img_id]['img_scale']
+
+    def stack(self, name, img_ids, dtype=np.float32):
+        """Return arrays of the same shape of several images stacked into one."""
+        out = None
+        for i in xrange(len(img_ids)):
+            arr = self.get(img_ids[i], name)
+            if out is None:
+                out = np.empty((len(img_ids),) + arr.shape, dtype=dtype)
+            out[i] = arr
+        return out
@@ -0,0 +1,70 @@
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Report the time spent importing modules, to find slow startup paths.
+
+Set WPAL_IMPORT_TIME=1 (or a number of lines to show) when running a tool.
+"""
+
+import __builtin__
+import atexit
+import sys
+import time
+
+_times = {}
+_stack = []
+
+
+def _timed_import(name, *args, **kwargs):
+    # Only time imports which actually load a module.
+    if name in sys.modules:
+        return _real_import(name, *args, **kwargs)
+
+    _stack.append(0.0)
+    t = time.time()
+    try:
+        return _real_import(name, *args, **kwargs)
+    finally:
+        total = time.time() - t
+        inner = _stack.pop()
+        if _stack:
+            _stack[-1] += total
+        if name not in _times:
+            _times[name] = (total, total - inner)
+
+
+def report(num=20):
+    """Print the slowest imports, with their total and own time."""
+    if not _times:
+        return
+    print >> sys.stderr, 'Slowest imports (total / self, in ms):'
+    for name, (total, own) in sorted(_times.iteritems(), key=lambda x: -x[1][0])[:num]:
+        print >> sys.stderr, '{:>10.1f} {:>10.1f}  {}'.format(total * 1000, own * 1000, name)
+
+
+def enable(num=20):
+    """Start timing imports, and report them when the process exits."""
+    global _real_import
+    if __builtin__.__import__ is _timed_import:
+        return
+    _real_import = __builtin__.__import__
+    __builtin__.__import__ = _timed_import
+    atexit.register(report, num)
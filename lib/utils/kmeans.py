@@ -23,7 +23,6 @@ import numpy as np
 
 from numpy import *
 import time
-import matplotlib.pyplot as plt
 
 
 # calculate Euclidean distance
@@ -41,46 +40,66 @@ def initCentroids(dataSet, k):
 	return centroids
 
 
-# Weighted k-means cluster
-def weighted_kmeans(dataSet, k, max_round = 100000):
+# init centroids with k-means++ seeding: each next centroid is a sample
+# picked with probability proportional to its weight times its squared
+# distance to the nearest centroid picked so far
+def initCentroidsPP(dataSet, k):
+	numSamples, dim = dataSet.shape
+	weights = np.maximum(dataSet[:, 2], 0)
+	centroids = zeros((k, dim))
+	minDist = np.full(numSamples, np.inf)
+	prob = weights
+	for i in range(k):
+		total = prob.sum()
+		if total > 0:
+			index = np.searchsorted(np.cumsum(prob), random.uniform(0, total), side='right')
+			index = min(index, numSamples - 1)
+		else:
+			index = int(random.uniform(0, numSamples))
+		centroids[i, :] = dataSet[index, :]
+		minDist = np.minimum(minDist, ((dataSet[:, :2] - centroids[i, :2]) ** 2).sum(axis=1))
+		prob = weights * minDist
+	return centroids
+
+
+# Weighted k-means cluster, on samples of rows (x, y, weight).
+# Returns the centroids as rows (x, y, total weight) sorted by weight, and
+# the index of the cluster and the squared distance to its centroid of each
+# sample.
+def weighted_kmeans(dataSet, k, max_round = 100000, tol = 1e-4):
+	dataSet = np.asarray(dataSet, dtype=float)
 	numSamples = dataSet.shape[0]
-	# first column stores which cluster this sample belongs to,
-	# second column stores the error between this sample and its centroid
-	clusterAssment = mat(zeros((numSamples, 2)))
-	clusterChanged = True
+	if numSamples == 0:
+		return [], mat(zeros((0, 2)))
 
-	## step 1: init centroids
-	centroids = initCentroids(dataSet, k)
-
-	round = 0
-	while clusterChanged and round < max_round:
-		round += 1
-		clusterChanged = False
-		## for each sample
-		for i in xrange(numSamples):
-			minDist = 100000.0
-			minIndex = 0
-			## for each centroid
-			## step 2: find the centroid who is closest
-			for j in range(k):
-				distance = euclDistance(centroids[j, :2], dataSet[i, :2])
-				if distance < minDist:
-					minDist = distance
-					minIndex = j
-
-			## step 3: update its cluster
-			if clusterAssment[i, 0] != minIndex:
-				clusterChanged = True
-				clusterAssment[i, :] = minIndex, minDist ** 2
-
-		## step 4: update centroids
-		for j in range(k):
-			pointsInCluster = dataSet[nonzero(clusterAssment[:, 0].A == j)[0]]
-			centroids[j, 2] = sum(pointsInCluster[:, 2])
-			for p in pointsInCluster:
-				p[:2] *= p[2]
-			centroids[j, :2] = sum(pointsInCluster[:, :2], axis=0) / centroids[j, 2]
+	points = dataSet[:, :2]
+	weights = dataSet[:, 2]
 
+	## step 1: init centroids
+	centroids = initCentroidsPP(dataSet, k)
+
+	assignment = np.full(numSamples, -1)
+	for round in xrange(max(1, max_round)):
+		## step 2: find the centroid closest to every sample at once
+		dist = ((points[:, np.newaxis, :] - centroids[np.newaxis, :, :2]) ** 2).sum(axis=2)
+		newAssignment = dist.argmin(axis=1)
+		clusterChanged = (newAssignment != assignment).any()
+		assignment = newAssignment
+
+		## step 3: move the centroids to the weighted means of their samples,
+		## leaving empty clusters where they are with no weight
+		clusterWeight = np.bincount(assignment, weights, minlength=k)
+		centroids[:, 2] = clusterWeight
+		oldCentroids = centroids[:, :2].copy()
+		nonEmpty = clusterWeight != 0
+		for d in xrange(2):
+			sums = np.bincount(assignment, weights * points[:, d], minlength=k)
+			centroids[nonEmpty, d] = sums[nonEmpty] / clusterWeight[nonEmpty]
+
+		if not clusterChanged or np.abs(centroids[:, :2] - oldCentroids).max() <= tol:
+			break
+
+	clusterAssment = mat(np.column_stack([assignment, dist[np.arange(numSamples), assignment]]))
 	centroids = sorted(centroids, key=lambda x:x[2], reverse=1)
 
 	return centroids, clusterAssment
@@ -88,6 +107,9 @@ def weighted_kmeans(dataSet, k, max_round = 100000):
 
 # show your cluster only available with 2-D data
 def showCluster(dataSet, k, centroids, clusterAssment):
+	# matplotlib is slow to load, and only needed here.
+	import matplotlib.pyplot as plt
+
 	numSamples, dim = dataSet.shape
 	if dim != 2:
 		print "Sorry! I can not draw because the dimension of your data is not 2!"
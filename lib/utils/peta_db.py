@@ -24,7 +24,6 @@
 import os.path as osp
 
 import numpy as np
-import scipy.io as sio
 
 import evaluate
 
@@ -33,6 +32,7 @@ class PETA:
     """This tool requires the PETA to be processed into similar form as RAP."""
 
     def __init__(self, db_path, par_set_id):
+        import scipy.io as sio
         self._db_path = db_path
 
         try:
@@ -23,7 +23,6 @@
 
 import os.path as osp
 import numpy as np
-import scipy.io as sio
 
 import evaluate
 from wpal_net.config import cfg
@@ -33,6 +32,7 @@ class RAP:
         self._db_path = db_path
         # self.lazy=
         if not lazy:
+            import scipy.io as sio
             rap = sio.loadmat(osp.join(self._db_path, 'RAP_annotation', 'RAP_annotation.mat'))['RAP_annotation']
 
         self._partition = rap[0][0][0]
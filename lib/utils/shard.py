@@ -0,0 +1,43 @@
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Split a run over a database into shards to be run separately."""
+
+import os.path as osp
+
+
+def parse_shard(s):
+    """Parse a shard given as 'i/n', meaning the i-th of n shards."""
+    i, n = [int(x) for x in s.split('/')]
+    if not 0 <= i < n:
+        raise ValueError('Invalid shard: {}'.format(s))
+    return i, n
+
+
+def shard_range(num, shard):
+    """Return the start and end positions of a shard in a list of num items."""
+    i, n = shard
+    return num * i / n, num * (i + 1) / n
+
+
+def shard_path(output_dir, name, shard):
+    """Return the path of a file holding partial results of a shard."""
+    return osp.join(output_dir, '{}_shard{}of{}.pkl'.format(name, shard[0], shard[1]))
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Backends to run a WPAL Network with: pycaffe, or the DNN module of OpenCV."""
+
+import collections
+import os
+import re
+
+import cv2
+import numpy as np
+
+from recog import recognize_attr, HEAT_BLOBS
+from weight_cache import is_weight_cache, WeightCache
+
+
+# Backends load_net is able to use
+BACKENDS = ('caffe', 'opencv')
+
+# Blobs the OpenCV backend computes, all being outputs of layers of the same names
+OUTPUT_BLOBS = ['pred', 'score'] + HEAT_BLOBS
+
+
+def range_prototxt(prototxt, start, end):
+    """Write a copy of a test network definition recognizing only attributes
+    [start, end), as the models trained by train_net.py with --start and
+    --end, and return its path.
+    The number of outputs of fc_syn2, the layer outputting the attribute
+    scores, is edited as text, so that no backend needs pycaffe for it.
+    """
+    text = open(prototxt).read()
+    name = re.search(r'name:\s*"fc_syn2"', text)
+    if name is None:
+        raise ValueError('No layer fc_syn2 in {}!'.format(prototxt))
+
+    # the block of the layer, from its opening brace to the closing one
+    begin = text.index('{', text.rfind('layer', 0, name.start()))
+    depth = 0
+    for end_pos in xrange(begin, len(text)):
+        if text[end_pos] == '{':
+            depth += 1
+        elif text[end_pos] == '}':
+            depth -= 1
+            if depth == 0:
+                break
+    block = re.sub(r'num_output:\s*\d+', 'num_output: {}'.format(end - start), text[begin:end_pos])
+    text = text[:begin] + block + text[end_pos:]
+
+    new_dir = os.path.join(os.path.dirname(prototxt), 'train_net_dir')
+    if not os.path.exists(new_dir):
+        os.makedirs(new_dir)
+
+    new_file = os.path.join(new_dir, 'test_net_{}_{}.prototxt'.format(start, end))
+    with open(new_file, 'w+') as f:
+        f.write(text)
+    return new_file
+
+
+class _Blob(object):
+    """A blob of an OpenCV network, as pycaffe exposes one."""
+
+    def __init__(self, shape):
+        self.data = np.zeros(shape, dtype=np.float32)
+
+    def reshape(self, *shape):
+        self.data = np.zeros(shape, dtype=np.float32)
+
+
+class CvDnnNet(object):
+    """Run a WPAL network with the DNN module of OpenCV, through the part of
+    the interface of caffe.Net used in recog: the blobs data, pred, score and
+    heat3-5, forward(end=...), _layer_names and top_names.
+    Networks using layers OpenCV does not implement, such as SPP, cannot be
+    loaded.
+    """
+
+    def __init__(self, prototxt, caffemodel):
+        self._net = cv2.dnn.readNetFromCaffe(prototxt, caffemodel)
+        self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self._net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+        self._layer_names = list(self._net.getLayerNames())
+        self.top_names = collections.OrderedDict((x, [x]) for x in self._layer_names)
+
+        self.outputs = [x for x in self._layer_names if x in OUTPUT_BLOBS]
+        self.blobs = collections.OrderedDict()
+        self.blobs['data'] = _Blob((1, 3, 224, 224))
+        for name in self.outputs:
+            self.blobs[name] = _Blob((1,))
+
+    def forward(self, start=None, end=None, **kwargs):
+        """Pass the data blob through the network, computing the outputs up
+        to layer end. Returns them in a dict like caffe.Net.forward does.
+        """
+        for name, data in kwargs.iteritems():
+            self.blobs[name].data[...] = data
+        last = self._layer_names.index(end) if end is not None else len(self._layer_names) - 1
+        names = [x for x in self.outputs if self._layer_names.index(x) <= last]
+
+        self._net.setInput(self.blobs['data'].data)
+        for name, data in zip(names, self._net.forward(names)):
+            self.blobs[name].data = data
+        return dict((x, self.blobs[x].data) for x in names)
+
+
+def load_net(prototxt, caffemodel, backend='caffe'):
+    """Load a WPAL network for testing with the given backend.
+    caffemodel may also be a weight cache written by tools/cache_weights.py,
+    which the caffe backend loads without parsing the model.
+    Caffe is set up (CPU or GPU mode) by the caller when using pycaffe.
+    """
+    if backend == 'caffe':
+        import caffe
+        if is_weight_cache(caffemodel):
+            net = caffe.Net(prototxt, caffe.TEST)
+            WeightCache(caffemodel).assign(net)
+            return net
+        return caffe.Net(prototxt, caffemodel, caffe.TEST)
+    elif backend == 'opencv':
+        if is_weight_cache(caffemodel):
+            raise ValueError('The opencv backend needs a caffemodel but not a weight cache!')
+        return CvDnnNet(prototxt, caffemodel)
+    raise ValueError('Unknown backend: {}'.format(backend))
+
+
+def load_weights(net, prototxt, caffemodel, backend='caffe'):
+    """Load the weights of another model of the same definition into a net
+    loaded by load_net, and return the net to use from then on. pycaffe nets
+    keep their blobs and shapes, while OpenCV networks are loaded anew.
+    """
+    if backend == 'caffe':
+        if is_weight_cache(caffemodel):
+            WeightCache(caffemodel).assign(net)
+        else:
+            net.copy_from(caffemodel)
+        return net
+    return load_net(prototxt, caffemodel, backend)
+
+
+def compare_nets(net, ref_net, imgs, attr_group):
+    """Pass images through two networks, e.g. of different backends, and
+    return the largest absolute difference between their outputs, for each
+    of pred, score and heat3-5.
+    """
+    diffs = dict((x, 0.0) for x in OUTPUT_BLOBS)
+    for img in imgs:
+        outputs = recognize_attr(net, img, attr_group)
+        ref_outputs = recognize_attr(ref_net, img, attr_group)
+        for name, x, y in [('pred', outputs[0], ref_outputs[0]), ('score', outputs[2], ref_outputs[2])] \
+                + zip(HEAT_BLOBS, outputs[1], ref_outputs[1]):
+            diffs[name] = max(diffs[name], float(np.abs(x - y).max()))
+    return diffs
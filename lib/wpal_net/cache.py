@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Cache of forward results of a WPAL network."""
+
+import collections
+import hashlib
+
+import numpy as np
+
+from config import cfg
+from recog import ALL_OUTPUTS, recognize_attr, discretize, _attr_group_norm
+from weight_cache import weights_file
+
+
+def _file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-1 digest of the content of a file."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.digest()
+
+
+class ForwardCache(object):
+    """An LRU cache in front of recognize_attr, bounded by the bytes of the
+    results it holds. Results are keyed by the content of the image, the
+    weights of the model and the cfg options affecting the network input, so
+    repeated requests for the same image skip the network entirely.
+    """
+
+    def __init__(self, weights_path, max_bytes):
+        self._model_digest = _file_digest(weights_file(weights_path))
+        self._max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, img, neglect, outputs):
+        h = hashlib.sha1(self._model_digest)
+        h.update(repr((img.shape, img.dtype.str, neglect, tuple(outputs),
+                       cfg.TEST.SCALE, cfg.TEST.MAX_AREA, cfg.MIN_SIZE, cfg.TEST.BUCKETS,
+                       cfg.TEST.RAW_INPUT)))
+        h.update(np.asarray(cfg.PIXEL_MEANS, dtype=np.float64).tostring())
+        h.update(np.ascontiguousarray(img).data)
+        return h.digest()
+
+    def _insert(self, key, entry):
+        size = sum([x.nbytes for x in (entry[0], entry[2]) if x is not None])
+        if entry[1] is not None:
+            size += sum([x.nbytes for x in entry[1]])
+        if size > self._max_bytes:
+            return
+
+        while self.num_bytes + size > self._max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.num_bytes -= evicted_size
+        self._entries[key] = (entry, size)
+        self.num_bytes += size
+
+    def recognize_attr(self, net, img, attr_group, threshold=None, neglect=False, outputs=ALL_OUTPUTS):
+        """Same as recog.recognize_attr, but looks the results up in the cache
+        first. The heat maps and scores returned are shared with the cache and
+        must not be modified.
+        """
+        key = self._key(img, neglect, outputs)
+        if key in self._entries:
+            self.hits += 1
+            entry, size = self._entries.pop(key)
+            self._entries[key] = (entry, size)
+        else:
+            self.misses += 1
+            entry = recognize_attr(net, img, [], None, neglect, outputs)
+            self._insert(key, entry)
+
+        pred, heat_maps, score, img_scale = entry
+        if pred is not None:
+            pred = pred.copy()
+
+            for group in attr_group:
+                pred = _attr_group_norm(pred, group)
+
+            if threshold is not None:
+                discretize(pred, threshold)
+
+        return pred, heat_maps, score, img_scale
+
+    def stats(self):
+        return 'Forward cache: {} entries, {:.1f} MB, {} hits, {} misses' \
+            .format(len(self._entries), self.num_bytes / 1048576.0, self.hits, self.misses)
@@ -86,6 +86,11 @@ __C.TRAIN.RGB_JIT = 16
 # Number of detectors to reserve when finding unutilized detectors.
 __C.TRAIN.NUM_RESERVE_DETECTOR = 64
 
+# Number of CPU cores, taken from the last ones available, to pin the process
+# preparing training minibatches to, limiting its threads to as many. 0 (the
+# default) leaves it unpinned.
+__C.TRAIN.FETCHER_CPUS = 0
+
 #
 # Testing options
 #
@@ -103,6 +108,47 @@ __C.TEST.MAX_AREA = 114688
 __C.TEST.MAX_NUM_ATTR = 9
 #2
 
+# Number of images to pass through the network in one forward. Images of a
+# batch are padded to the largest of them, and pooling of the predictions and
+# detector scores runs over the padding too, so results with a batch size
+# above 1 depend on which images share a batch.
+__C.TEST.BATCH_SIZE = 1
+
+# Max number of images the server (tools/serve.py) passes through the network
+# in one forward. Only images of the same prepared shape share a batch, so
+# results do not depend on concurrent requests. Set TEST.BUCKETS for images
+# of various shapes to be batched together.
+__C.TEST.SERVE_BATCH_SIZE = 8
+
+# Number of BLAS and OpenMP threads of a network testing on CPU, which takes
+# effect only if set before Caffe is loaded. 0 leaves it to the libraries.
+# Set by the profile written by tools/autotune.py
+__C.TEST.NUM_THREADS = 0
+
+# Number of threads reading and preparing test images ahead of the network
+__C.TEST.PREFETCH_THREADS = 4
+
+# Max number of test images read ahead of the network
+__C.TEST.PREFETCH_DEPTH = 64
+
+# Canonical input shapes ([height, width]) to snap scaled test images onto.
+# Images are edge-padded up to the smallest bucket holding them, so that the
+# network is not reshaped for every image. Leave empty to disable.
+__C.TEST.BUCKETS = []
+
+# Scales to average predictions over for test-time augmentation, enabled by
+# --tta of test_net.py, usually picked from TRAIN.SCALES. Leave empty to use
+# TEST.SCALE only.
+__C.TEST.TTA_SCALES = []
+
+# Whether to also average over horizontally-flipped images for test-time
+# augmentation
+__C.TEST.TTA_FLIP = True
+
+# Whether to feed images without subtracting PIXEL_MEANS, for models exported
+# by tools/export_deploy.py with the means folded into the first convolution
+__C.TEST.RAW_INPUT = False
+
 #
 # Attribute localizing options
 #
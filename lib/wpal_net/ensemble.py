@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Recognize all attributes with an ensemble of models, each trained on a
+range of attributes, running concurrently in processes of their own.
+"""
+
+import os
+import shutil
+import tempfile
+from multiprocessing import Process, Pipe
+
+import numpy as np
+from utils.cpu_budget import assign_cpus, pin_process, report_cpus
+
+from backend import load_net
+from config import cfg
+from recog import prep_image, discretize, warm_up, _attr_group_norm, _blob_shape, _fill_blob, _last_layer
+
+
+def _ensemble_worker(prototxt, caffemodel, gpu_id, cpus, backend, conn):
+    try:
+        pin_process(cpus)
+        if backend == 'caffe':
+            import caffe
+            if gpu_id == -1:
+                caffe.set_mode_cpu()
+            else:
+                caffe.set_mode_gpu()
+                caffe.set_device(gpu_id)
+
+        net = load_net(prototxt, caffemodel, backend)
+        warm_up(net)
+        end = _last_layer(net, ['pred'])
+    except Exception as e:
+        conn.send(e)
+        conn.close()
+        return
+    conn.send('ready')
+
+    views = {}
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        path, shape = msg
+        try:
+            if path not in views:
+                views.clear()
+                views[path] = np.memmap(path, dtype=np.float32, mode='r')
+            data = views[path][:np.prod(shape)].reshape(shape)
+            if net.blobs['data'].data.shape != shape:
+                net.blobs['data'].reshape(*shape)
+            net.blobs['data'].data[...] = data
+            net.forward(end=end)
+            conn.send(net.blobs['pred'].data[:shape[0]].reshape(shape[0], -1).copy())
+        except Exception as e:
+            conn.send(e)
+    conn.close()
+
+
+class Ensemble(object):
+    """Models of ranges of attributes, each run by a worker process with its
+    own network. Images are prepared once and written into a blob in shared
+    memory, which every worker passes through its network at the same time.
+    Predictions are stitched into one vector in the order of the attributes.
+    """
+
+    def __init__(self, models, num_attr, attr_group, gpu_ids=None, num_threads=None, backend='caffe'):
+        """
+        Arguments:
+            models (list):      (start, end, prototxt, caffemodel) of every
+                                model. The ranges [start, end) must cover
+                                the num_attr attributes without overlapping.
+            attr_group (list):  ranges of mutually exclusive attributes.
+            gpu_ids (list):     GPUs to assign the models to in turn.
+                                Defaults to using CPU only.
+            num_threads (int):  number of CPU cores and BLAS threads of each
+                                worker. Defaults to sharing the CPU cores
+                                evenly.
+            backend (str):      library to run the networks with, see
+                                load_net.
+        """
+        covered = np.zeros(num_attr, dtype=int)
+        for start, end, _, _ in models:
+            covered[start:end] += 1
+        if (covered != 1).any():
+            raise ValueError('Attribute ranges of the models must cover all {} attributes exactly once!'
+                             .format(num_attr))
+
+        assignment = assign_cpus(len(models), num_threads)
+
+        self.ranges = [(start, end) for start, end, _, _ in models]
+        self.num_attr = num_attr
+        self.attr_group = attr_group
+
+        self._shm_dir = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        self._shm_path = None
+        self._shm = None
+        self._shm_cnt = 0
+
+        self._conns = []
+        self._workers = []
+        for k, (_, _, prototxt, caffemodel) in enumerate(models):
+            gpu_id = gpu_ids[k % len(gpu_ids)] if gpu_ids else -1
+            conn, child_conn = Pipe()
+            worker = Process(target=_ensemble_worker,
+                             args=(prototxt, caffemodel, gpu_id, assignment[k], backend, child_conn))
+            worker.daemon = True
+            worker.start()
+            # Only the worker holds its end, so that its death ends the pipe.
+            child_conn.close()
+            self._conns.append(conn)
+            self._workers.append(worker)
+        msgs = [self._recv(k) for k in xrange(len(models))]
+        for msg in msgs:
+            if isinstance(msg, Exception):
+                self.close()
+                raise msg
+        report_cpus(assignment, ['attributes {}-{}'.format(start, end) for start, end in self.ranges])
+
+    def _recv(self, k):
+        """Receive a message from the k-th worker, or an error if it died."""
+        try:
+            return self._conns[k].recv()
+        except EOFError:
+            self._workers[k].join()
+            return RuntimeError('Worker of attributes {}-{} died with exit code {}!'
+                                .format(self.ranges[k][0], self.ranges[k][1], self._workers[k].exitcode))
+
+    def _shared_blob(self, shape):
+        """Return a blob of given shape in shared memory, growing it if needed."""
+        size = int(np.prod(shape))
+        if self._shm is None or self._shm.size < size:
+            if self._shm_path is not None:
+                del self._shm
+                os.remove(self._shm_path)
+            self._shm_cnt += 1
+            self._shm_path = os.path.join(self._shm_dir, 'blob{}'.format(self._shm_cnt))
+            self._shm = np.memmap(self._shm_path, dtype=np.float32, mode='w+', shape=(size,))
+        return self._shm[:size].reshape(shape)
+
+    def recognize_prepped(self, prepped, threshold=None):
+        """Recognize attributes in a batch of images prepared by prep_image.
+        Returns a list of the prediction vectors of all attributes.
+        """
+        imgs = [x[0] for x in prepped]
+        shape = _blob_shape(imgs)
+        _fill_blob(self._shared_blob(shape), imgs, edge_pad=len(cfg.TEST.BUCKETS) > 0)
+
+        for conn in self._conns:
+            conn.send((self._shm_path, shape))
+        # Receive from every worker before raising, to keep them in step.
+        parts = [self._recv(k) for k in xrange(len(self._conns))]
+        for part in parts:
+            if isinstance(part, Exception):
+                raise part
+
+        preds = np.zeros((len(imgs), self.num_attr), dtype=np.float32)
+        for (start, end), part in zip(self.ranges, parts):
+            preds[:, start:end] = part
+
+        results = []
+        for pred in preds:
+            for group in self.attr_group:
+                pred = _attr_group_norm(pred, group)
+            if threshold is not None:
+                discretize(pred, threshold)
+            results.append(pred)
+        return results
+
+    def recognize_attr(self, img, threshold=None, neglect=False):
+        """Recognize attributes of a pedestrian image.
+        Returns the prediction vector and the image scale used.
+        """
+        prepped = prep_image(img, neglect)
+        return self.recognize_prepped([prepped], threshold)[0], prepped[1]
+
+    def close(self):
+        for conn, worker in zip(self._conns, self._workers):
+            if worker.is_alive():
+                try:
+                    conn.send(None)
+                except IOError:
+                    pass
+        for worker in self._workers:
+            worker.join()
+        self._shm = None
+        shutil.rmtree(self._shm_dir)
@@ -24,64 +24,132 @@
 import cPickle
 import os
 
-import cv2
 import numpy as np
 
 from config import cfg
-from recog import recognize_attr
+from loc import binding_index
+from prefetch import prefetch_images
+from recog import recognize_prepped
+from utils.feature_store import FeatureStore, FeatureWriter
+from utils.shard import shard_range, shard_path
 
 
-def estimate_param(net, db, output_dir, res_file, save_res=False):
-    attrs = []
-    scores = []
-    labels = []
+def _accumulate(sums, labels, scores):
+    """Add up detector scores of images by attribute, separately over images
+    labeled positive and negative. Returns the updated sums, which are
+    created if sums is None.
+    """
+    labels = np.asarray(labels)
+    scores = np.asarray(scores, dtype=float)
+    pos = (labels > 0.5).astype(float)
+    neg = (labels < 0.5).astype(float)
+
+    if sums is None:
+        sums = {'pos_sum': np.zeros((labels.shape[1], scores.shape[1])),
+                'neg_sum': np.zeros((labels.shape[1], scores.shape[1])),
+                'pos_cnt': np.zeros(labels.shape[1], dtype=int),
+                'neg_cnt': np.zeros(labels.shape[1], dtype=int)}
+    sums['pos_sum'] += pos.T.dot(scores)
+    sums['neg_sum'] += neg.T.dot(scores)
+    sums['pos_cnt'] += pos.sum(axis=0).astype(int)
+    sums['neg_cnt'] += neg.sum(axis=0).astype(int)
+    return sums
+
+
+def _estimate_binding(db, sums, output_dir):
+    """Estimate the binding from the sums of scores and save it to detector.pkl."""
+    pos_ave = np.zeros(sums['pos_sum'].shape)  # binding between attribute and detector or detector bin
+    neg_ave = np.zeros(sums['neg_sum'].shape)  # binding between attribute and detector or detector bin
+    for i in xrange(db.num_attr):
+        print 'For attr {}: pos={}; neg={}'.format(i, sums['pos_cnt'][i], sums['neg_cnt'][i])
+        pos_ave[i] = sums['pos_sum'][i] / sums['pos_cnt'][i]
+        neg_ave[i] = sums['neg_sum'][i] / len(sums['neg_sum'][i])
+        print 'Estimated attr {}/{}'.format(i, db.num_attr)
+    binding = np.exp(pos_ave / neg_ave)
+
+    # the bins locate uses for each attribute, so that it need not rank all of them
+    index = binding_index(pos_ave, neg_ave, binding)
+
+    detector_file = os.path.join(output_dir, 'detector.pkl')
+    with open(detector_file, 'wb') as f:
+        cPickle.dump({'pos_ave': pos_ave, 'neg_ave': neg_ave, 'binding': binding, 'index': index},
+                     f, cPickle.HIGHEST_PROTOCOL)
+
+    return binding, pos_ave, neg_ave
+
+
+def estimate_param(net, db, output_dir, res_file, save_res=False, shard=None):
+    """Estimate the binding between attributes and detector bins.
+    Recognition results are read from res_file if it is given, which is
+    either a feature store directory or a pickle of an older version.
+    Otherwise they are computed using the net on the training set, and are
+    saved into a feature store under output_dir if save_res is set.
+    If shard (i, n) is given, only the i-th of n slices of the training images
+    is used, and the partial sums are saved to be merged by
+    merge_estimate_shards instead. None is returned then.
+    """
+    inds = db.train_ind
+    start, end = 0, len(inds)
+    if shard is not None:
+        start, end = shard_range(len(inds), shard)
+        inds = inds[start:end]
+
+    sums = None
 
     if res_file == None:
+        store_dir = os.path.join(output_dir, 'val_features')
+        if shard is not None:
+            store_dir += '_shard{}of{}'.format(shard[0], shard[1])
+        writer = FeatureWriter(store_dir) if save_res else None
         cnt = 0
-        for i in db.train_ind:
-            img = cv2.imread(db.get_img_path(i))
-            attr, _, score, _ = recognize_attr(net, img, db.attr_group)
-            attrs.append(attr)
-            scores.append([x for x in score])
-            labels.append(db.labels[i])
-            cnt += 1
-            if cnt % 1000 == 0:
-                print 'Tested: {}/{}'.format(cnt, db.train_ind.__len__())
-
-        if save_res:
-            print 'Saving results...'
-            val_file = os.path.join(output_dir, 'val.pkl')
-            with open(val_file, 'wb') as f:
-                cPickle.dump({'attrs': attrs, 'scores': scores}, f, cPickle.HIGHEST_PROTOCOL)
-            print 'Results stored to {}!'.format(val_file)
+        for batch_inds, prepped in prefetch_images(db, inds):
+            results = recognize_prepped(net, prepped, db.attr_group, outputs=('pred', 'score'))
+            if writer is not None:
+                for i, (attr, _, score, img_scale, _) in zip(batch_inds, results):
+                    writer.add(i, img_scale, pred=attr, score=score)
+            sums = _accumulate(sums, db.labels[batch_inds], [x[2] for x in results])
+            for _ in batch_inds:
+                cnt += 1
+                if cnt % 1000 == 0:
+                    print 'Tested: {}/{}'.format(cnt, len(inds))
+
+        if writer is not None:
+            writer.close()
+            print 'Results stored to {}!'.format(store_dir)
+    elif os.path.isdir(res_file):
+        print 'Loading stored results from {}.'.format(res_file)
+        store = FeatureStore(res_file)
+        sums = _accumulate(sums, db.labels[inds], store.stack('score', inds))
+        print 'Stored results loaded!'
     else:
         print 'Loading stored results from {}.'.format(res_file)
         pack = cPickle.load(open(res_file, 'rb'))
-        attrs = pack['attrs']
-        scores = pack['scores']
-        labels = db.labels[db.train_ind]
+        sums = _accumulate(sums, db.labels[inds], pack['scores'][start:end])
         print 'Stored results loaded!'
 
-    pos_ave = np.zeros((db.num_attr, len(scores[0])))  # binding between attribute and detector or detector bin
-    neg_ave = np.zeros((db.num_attr, len(scores[0])))  # binding between attribute and detector or detector bin
-    # Estimate detector binding
-    for i in xrange(db.num_attr):
-        pos_ind = np.where(np.array([x[i] for x in labels]) > 0.5)[0]
-        neg_ind = np.where(np.array([x[i] for x in labels]) < 0.5)[0]
-        print 'For attr {}: pos={}; neg={}'.format(i, len(pos_ind),len(neg_ind))
-        pos_sum = np.zeros(len(scores[0]), dtype=float)
-        neg_sum = np.zeros(len(scores[0]), dtype=float)
-        for j in pos_ind:
-            pos_sum += np.array(scores[j])
-        for j in neg_ind:
-            neg_sum += np.array(scores[j])
-        pos_ave[i] = pos_sum / len(pos_ind)
-        neg_ave[i] = neg_sum / len(neg_sum)
-        print 'Estimated attr {}/{}'.format(i, db.num_attr)
-    binding = np.exp(pos_ave / neg_ave)
+    if shard is not None:
+        part_file = shard_path(output_dir, 'detector', shard)
+        with open(part_file, 'wb') as f:
+            cPickle.dump(sums, f, cPickle.HIGHEST_PROTOCOL)
+        print 'Sums of shard {}/{} saved to {}!'.format(shard[0], shard[1], part_file)
+        return None
 
-    detector_file = os.path.join(output_dir, 'detector.pkl')
-    with open(detector_file, 'wb') as f:
-        cPickle.dump({'pos_ave': pos_ave, 'neg_ave': neg_ave, 'binding': binding}, f, cPickle.HIGHEST_PROTOCOL)
+    return _estimate_binding(db, sums, output_dir)
+
+
+def merge_estimate_shards(db, output_dir, num_shards):
+    """Merge the partial sums saved by the shards of an estimation run, and
+    estimate the binding just as a single run of estimate_param would.
+    """
+    sums = None
+    for i in xrange(num_shards):
+        part_file = shard_path(output_dir, 'detector', (i, num_shards))
+        with open(part_file, 'rb') as f:
+            part = cPickle.load(f)
+        if sums is None:
+            sums = part
+        else:
+            for k in sums:
+                sums[k] += part[k]
 
-    return binding, pos_ave, neg_ave
\ No newline at end of file
+    return _estimate_binding(db, sums, output_dir)
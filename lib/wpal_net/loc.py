@@ -23,12 +23,15 @@
 
 """Test localization of a WPAL Network."""
 
+import collections
 import math
 import os
+import threading
 import cv2
 import numpy as np
 
-from recog import recognize_attr, ResizedImageTooLargeException, ResizedSideTooShortException
+from recog import recognize_attr, recognize_same_shape, prep_image, discretize, HEAT_BLOBS, \
+    ResizedImageTooLargeException, ResizedSideTooShortException
 from config import cfg
 from utils.kmeans import weighted_kmeans
 
@@ -42,21 +45,180 @@ colors = [
 ]
 
 
+# Max number of masks kept by zero_mask. Masks depend only on the heat map
+# shape and the cell layout, so they repeat over images and attributes.
+_MASK_CACHE_SIZE = 256
+
+_masks = collections.OrderedDict()
+_masks_lock = threading.Lock()
+
+
 def gaussian_filter(shape, center_y, center_x, var=1):
-    filter_map = np.ndarray(shape)
-    for i in xrange(0, shape[0]):
-        for j in xrange(0, shape[1]):
-            filter_map[i][j] = math.exp(-(math.pow(i - center_y, 2) + math.pow(j - center_x, 2)) / 2 / var)
-    return filter_map
+    """Return a Gaussian map of the given shape around the center, built as
+    the outer product of its profiles along y and x.
+    """
+    gy = np.exp(-(np.arange(shape[0]) - center_y) ** 2 / 2.0 / var)
+    gx = np.exp(-(np.arange(shape[1]) - center_x) ** 2 / 2.0 / var)
+    return np.outer(gy, gx)
 
 
 def zero_mask(size, area):
+    """Return a map of the given size which is 1 in the area and 0 elsewhere.
+    Masks are cached, least recently used first out, and are read-only as
+    they are shared by all callers, in any thread.
+    """
+    y, x, h, w = area['y'], area['x'], area['h'], area['w']
+    key = (tuple(size), y, x, h, w)
+
+    with _masks_lock:
+        mask = _masks.pop(key, None)
+        if mask is not None:
+            _masks[key] = mask
+            return mask
+
     mask = np.zeros(size)
-    for i in xrange(int(math.floor(area['y'])), min(size[0], int(math.ceil(area['y'] + area['h'])))):
-        mask[i][int(math.floor(area['x'])):min(size[1], int(math.ceil(area['x'] + area['w'])))] += 1
+    mask[int(math.floor(y)):min(size[0], int(math.ceil(y + h))),
+         int(math.floor(x)):min(size[1], int(math.ceil(x + w)))] = 1
+    mask.setflags(write=False)
+
+    with _masks_lock:
+        if key not in _masks and len(_masks) >= _MASK_CACHE_SIZE:
+            _masks.popitem(last=False)
+        _masks[key] = mask
     return mask
 
 
+# Bins contribute to locating an attribute if bound to it at least as much as
+# the bin of this rank (from 0) in descending order of binding.
+TOP_BINS = 512
+
+
+def top_bins(pos_ave, neg_ave, dweight):
+    """Return the bins contributing to locating an attribute, given its
+    binding with all bins: their indexes, log binding, and average scores
+    on positive and negative samples.
+    """
+    log_weight = np.log(dweight)
+    threshold = np.sort(log_weight)[::-1][min(TOP_BINS, len(log_weight) - 1)]
+    bins = np.nonzero(~(log_weight < threshold))[0]
+    return bins, log_weight[bins], pos_ave[bins], neg_ave[bins]
+
+
+def binding_index(pos_ave, neg_ave, binding):
+    """Return the top_bins of every attribute, saved with the binding so that
+    locate does not rank all bins on every call.
+    """
+    return [top_bins(p, n, b) for p, n, b in zip(pos_ave, neg_ave, binding)]
+
+
+def _levels(layer):
+    """Return the pooling levels of a localization layer in cfg.LOC.LAYERS."""
+    return layer.get('LEVELS', layer.get('NUM_BIN', [[1, 1]]))
+
+
+class LocLayout(object):
+    """Where each bin of the score vector comes from, as flat arrays indexed
+    by bin: the layer, level, detector and cell (y, x) in the grid of the
+    level, and the effect area of the cell as fractions of the heat map.
+    Bins are laid out layer by layer, then level by level, then detector by
+    detector, then cell by cell in row-major order. Cells of all levels are
+    also numbered globally, as the detectors of a cell share its area.
+    """
+
+    def __init__(self, loc_layers):
+        layer_inds, level_inds, detectors, ys, xs, cells = [], [], [], [], [], []
+        area = []
+        num_cells = 0
+        for layer_ind, layer in enumerate(loc_layers):
+            overlap = [float(v) for v in layer.OVERLAP]
+            for level_ind, level in enumerate(_levels(layer)):
+                ny, nx = level[0], level[1]
+                num = layer.NUM_DETECTOR * ny * nx
+                ind = np.arange(num)
+                layer_inds.append(np.full(num, layer_ind, dtype=int))
+                level_inds.append(np.full(num, level_ind, dtype=int))
+                detectors.append(ind / (ny * nx))
+                ys.append(ind % (ny * nx) / nx)
+                xs.append(ind % nx)
+                cells.append(num_cells + ind % (ny * nx))
+                num_cells += ny * nx
+
+                bin_h = (1 + overlap[0] * (ny - 1)) / ny
+                bin_w = (1 + overlap[1] * (nx - 1)) / nx
+                area.append(np.column_stack([(1 - overlap[0]) * ys[-1] * bin_h,
+                                             (1 - overlap[1]) * xs[-1] * bin_w,
+                                             np.full(num, bin_h),
+                                             np.full(num, bin_w)]))
+
+        self.layer = np.concatenate(layer_inds)
+        self.level = np.concatenate(level_inds)
+        self.detector = np.concatenate(detectors)
+        self.y = np.concatenate(ys)
+        self.x = np.concatenate(xs)
+        self.cell = np.concatenate(cells)
+        # y, x, h and w of the effect areas, relative to the heat map size
+        self.area = np.concatenate(area)
+        self.num_bins = len(self.layer)
+
+    def heat_shapes(self, heat_maps, bins=None):
+        """Return the height and width of the heat map of the given bins,
+        defaulting to all of them.
+        """
+        shapes = np.array([heat.shape[1:3] for heat in heat_maps], dtype=float)
+        return shapes[self.layer if bins is None else self.layer[bins]]
+
+    def effect_areas(self, heat_maps, bins=None):
+        """Return the effect area (y, x, h, w) of the given bins in the pixels
+        of their heat maps.
+        """
+        area = self.area if bins is None else self.area[bins]
+        return area * np.tile(self.heat_shapes(heat_maps, bins), 2)
+
+    def cell_groups(self, bins):
+        """Group bins by grid cell. Yields the positions in bins of each cell."""
+        cells = self.cell[bins]
+        for cell in np.unique(cells):
+            yield np.nonzero(cells == cell)[0]
+
+    def targets(self, heat_maps, bins=None):
+        """Return the location (y, x) in its heat map of the target each of
+        the given bins detects, i.e. the maximum of its heat map within its
+        effect area, at the center of the pixel. One argmax is taken over the
+        detectors of a grid cell at once.
+        """
+        if bins is None:
+            bins = np.arange(self.num_bins)
+        areas = self.effect_areas(heat_maps, bins)
+        targets = np.zeros((len(bins), 2))
+        for sel in self.cell_groups(bins):
+            heat = heat_maps[self.layer[bins[sel[0]]]]
+            y, x, h, w = areas[sel[0]]
+            y0 = min(int(math.floor(y)), heat.shape[1] - 1)
+            x0 = min(int(math.floor(x)), heat.shape[2] - 1)
+            y1 = max(y0 + 1, min(heat.shape[1], int(math.ceil(y + h))))
+            x1 = max(x0 + 1, min(heat.shape[2], int(math.ceil(x + w))))
+            region = heat[self.detector[bins[sel]], y0:y1, x0:x1].reshape(len(sel), -1)
+            loc = region.argmax(axis=1)
+            targets[sel, 0] = y0 + loc / (x1 - x0) + 0.5
+            targets[sel, 1] = x0 + loc % (x1 - x0) + 0.5
+        return targets
+
+
+_layouts = {}
+
+
+def get_loc_layout(loc_layers=None):
+    """Return the LocLayout of the localization layers, defaulting to
+    cfg.LOC.LAYERS, compiled once for each configuration.
+    """
+    if loc_layers is None:
+        loc_layers = cfg.LOC.LAYERS
+    key = repr(loc_layers)
+    if key not in _layouts:
+        _layouts[key] = LocLayout(loc_layers)
+    return _layouts[key]
+
+
 def cluster_heat(img, k, stepsX, max_round=1000):
     """Return centroids of heat clusters (in x-y order)."""
     stepsY = stepsX * img.shape[0] / img.shape[1]
@@ -66,18 +228,47 @@ def cluster_heat(img, k, stepsX, max_round=1000):
     dy = img.shape[0] / stepsY
     dx = img.shape[1] / stepsX
 
-    act_points = []
-    for y in xrange(stepsY):
-        for x in xrange(stepsX):
-            score = img[y * dy: (y + 1) * dy, x * dx: (x + 1) * dx]
-            if score > thresh:
-                act_points.append([x, y, score])
-    act_points = np.array(act_points)
+    # score of each cell of the grid, and the cells above the threshold
+    scores = img[:stepsY * dy, :stepsX * dx].reshape(stepsY, dy, stepsX, dx).mean(axis=(1, 3))
+    ys, xs = np.nonzero(scores > thresh)
+    act_points = np.column_stack([xs, ys, scores[ys, xs]])
 
     centroids, _ = weighted_kmeans(act_points, k, max_round)
     return centroids
 
 
+def _superpose(layout, heat_maps, bins, w, center_y, center_x, img_height, img_width):
+    """Sum the heat maps of the given bins weighted by w, each masked by the
+    effect area of its bin and by a Gaussian around the center of the
+    feature, into a map of the image size.
+    The Gaussian is the same for all the bins of a layer, and the mask for
+    all the detectors of a grid cell, so the maps of a layer are summed at
+    their own resolution and resized to the image once.
+    """
+    areas = layout.effect_areas(heat_maps, bins)
+    img_area = img_height * img_width
+
+    accs = {}
+    for sel in layout.cell_groups(bins):
+        layer_ind = layout.layer[bins[sel[0]]]
+        heat = heat_maps[layer_ind]
+        shape = heat.shape[1:3]
+        if layer_ind not in accs:
+            accs[layer_ind] = np.zeros(shape)
+        maps = heat[layout.detector[bins[sel]]].reshape(len(sel), -1).astype(float)
+        accs[layer_ind] += w[sel].dot(maps).reshape(shape) * zero_mask(shape, dict(zip('yxhw', areas[sel[0]])))
+
+    superposition = np.zeros((img_height, img_width))
+    for layer_ind, acc in accs.iteritems():
+        shape = acc.shape
+        acc *= gaussian_filter(shape,
+                               center_y * shape[0],
+                               center_x * shape[1],
+                               img_area / shape[0] * shape[1])
+        superposition += cv2.resize(acc, (img_width, img_height))
+    return superposition
+
+
 def locate(scaled_img,
            pos_ave, neg_ave, dweight,
            attr_id,
@@ -86,109 +277,48 @@ def locate(scaled_img,
            heat_maps,
            score,
            display=True,
-           vis_img_dir=None):
-    dweight = np.log(dweight)
-    weight_threshold = [sorted(x, reverse=1)[512] for x in dweight]
-
-    num_bin_per_detector = []
-    num_bin_per_layer = []
-    for layer in cfg.LOC.LAYERS:
-        bin_cnt = 0
-        for level in layer.LEVELS:
-            bin_cnt += level[0] * level[1]
-        num_bin_per_detector.append(bin_cnt)
-        num_bin_per_layer.append(bin_cnt * layer.NUM_DETECTOR)
-
-    # find the index of layer the bin belongs to, given a global index of a bin
-    def find_layer_ind(bin_ind):
-        for i in xrange(len(num_bin_per_layer)):
-            if bin_ind < num_bin_per_layer[i]:
-                return i
-            bin_ind -= num_bin_per_layer[i]
+           vis_img_dir=None,
+           index=None):
+    """Locate an attribute in an image from the heat maps of the bins bound
+    to it the most. index is the binding index saved by estimate_param with
+    the detector weights; the bins are found from dweight if not given.
+    """
+    layout = get_loc_layout()
+    if layout.num_bins != len(score):
+        raise ValueError('Bin layout of cfg.LOC.LAYERS does not match the {} bins of the score!'
+                         .format(len(score)))
 
     img_height = scaled_img.shape[0]
     img_width = scaled_img.shape[1]
     img_area = img_height * img_width
     cross_len = math.sqrt(img_area) * 0.05
 
-    layer_inds = [find_layer_ind(x) for x in xrange(len(score))]
-
-    def locate_bin_in_layer(bin_ind):
-        layer_ind = layer_inds[bin_ind]
-        """return: level_ind, detector_ind, bincentroids[1], bincentroids[0]"""
-        layer = cfg.LOC.LAYERS[layer_ind]
-        for i in xrange(layer_ind):
-            bin_ind -= num_bin_per_layer[i]
-        for i in xrange(len(layer.LEVELS)):
-            level = layer.LEVELS[i]
-            if bin_ind >= level[0] * level[1] * layer.NUM_DETECTOR:
-                bin_ind -= level[0] * level[1] * layer.NUM_DETECTOR
-            else:
-                return i, bin_ind / (level[0] * level[1]), \
-                       bin_ind % (level[0] * level[1]) / level[1], bin_ind % level[1]
-
-    # find heat map of a bin
-    def find_heat_map(bin_ind):
-        layer_ind = layer_inds[bin_ind]
-        heat_ind = 0
-        for i in xrange(layer_ind):
-            heat_ind += cfg.LOC.LAYERS[i].NUM_DETECTOR
-        _, detector_ind, _, _ = locate_bin_in_layer(bin_ind)
-        return heat_maps[heat_ind + detector_ind]
-
-    bin2heat = [find_heat_map(x) for x in xrange(len(score))]
-
-    def get_effect_area(bin_ind):
-        layer_ind = layer_inds[bin_ind]
-        heat = bin2heat[bin_ind]
-        level_ind, _, y, x = locate_bin_in_layer(bin_ind)
-        layer = cfg.LOC.LAYERS[layer_ind]
-        level = layer.LEVELS[level_ind]
-        bin_h = heat.shape[0] * (1 + layer.OVERLAP[0] * (level[0] - 1)) / level[0]
-        bin_w = heat.shape[1] * (1 + layer.OVERLAP[1] * (level[1] - 1)) / level[1]
-        y_start = (1 - layer.OVERLAP[0]) * y * bin_h
-        x_start = (1 - layer.OVERLAP[1]) * x * bin_h
-        return {'y': y_start, 'x': x_start, 'h': bin_h, 'w': bin_w}
-
-    # find the target a bin detects.
-    # TODO: check the target location against the bin's region
-    def find_target(bin_ind):
-        effect_area = get_effect_area(bin_ind)
-        locs = np.where(bin2heat[bin_ind] == score[bin_ind])
-        if len(locs[0]) == 0:
-            print 'Cannot find max value {} of bin {}'.format(score[bin_ind], bin_ind)
-            return [0]
-        if len(locs[0]) > 1:
-            for i in xrange(len(locs[0])):
-                loc = [locs[0][i], locs[1][i]]
-                if effect_area['y'] <= loc[0] < effect_area['y'] + effect_area['h'] \
-                        and effect_area['x'] <= loc[1] < effect_area['x'] + effect_area['w']:
-                    return loc[0] + 0.5, loc[1] + 0.5
-        return locs[0][0] + 0.5, locs[1][0] + 0.5
+    # the bins contributing to the attribute, and their weights
+    if index is not None:
+        bins, log_weight, pos, neg = index[attr_id]
+    else:
+        bins, log_weight, pos, neg = top_bins(pos_ave[attr_id], neg_ave[attr_id], dweight[attr_id])
+    w = score[bins] / (pos if attr[attr_id] else neg) * log_weight
+    w_sum = w.sum()
+
+    # size of the heat map of every bin
+    heat_shapes = layout.heat_shapes(heat_maps, bins)
 
     # find all the targets in advance
-    target = [find_target(j) for j in xrange(len(score))]
+    target = layout.targets(heat_maps, bins)
 
     canvas = np.array(scaled_img)
 
-    # calc the actual contribution weights
-    def w_func(x):
-        return 0 \
-            if dweight[attr_id][x] < weight_threshold[attr_id] \
-            else score[x] / (pos_ave[attr_id][x] if attr[attr_id] else neg_ave[attr_id][x]) * dweight[attr_id][x]
-
-    w_sum = sum([w_func(j) for j in xrange(len(score))])
-
     if display or vis_img_dir is not None:
-        for j in [_[0] for _ in sorted(enumerate([w_func(k) for k in xrange(len(score))]),
-                                       key=lambda x: x[1],
-                                       reverse=1)][0:8]:
-            val_scale = 255.0 / max(max(__) for __ in bin2heat[j])
+        for k in np.argsort(-w, kind='mergesort')[0:8]:
+            j = bins[k]
+            heat = heat_maps[layout.layer[j]][layout.detector[j]]
+            val_scale = 255.0 / heat.max()
             heat_vis = np.zeros_like(scaled_img)
-            heat_vis[..., 2] = cv2.resize((bin2heat[j] * val_scale).astype('uint8'),
+            heat_vis[..., 2] = cv2.resize((heat * val_scale).astype('uint8'),
                                           (scaled_img.shape[1], scaled_img.shape[0]))
-            y = 1.0 * target[j][0] / bin2heat[j].shape[0]
-            x = 1.0 * target[j][1] / bin2heat[j].shape[1]
+            y = target[k][0] / heat_shapes[k][0]
+            x = target[k][1] / heat_shapes[k][1]
             cv2.line(heat_vis,
                      (int(img_width * x - cross_len), int(img_height * y)),
                      (int(img_width * x + cross_len), int(img_height * y)),
@@ -209,19 +339,9 @@ def locate(scaled_img,
                             heat_vis)
 
     # Center of the feature.
-    center_y = sum([w_func(j) / w_sum * target[j][0] / bin2heat[j].shape[0]
-                    for j in xrange(len(score))])
-    center_x = sum([w_func(j) / w_sum * target[j][1] / bin2heat[j].shape[1]
-                    for j in xrange(len(score))])
+    center_y, center_x = (w / w_sum).dot(target / heat_shapes)
     # Superposition of the heat maps.
-    superposition = sum([cv2.resize(w_func(j) / w_sum * bin2heat[j].astype(float)
-                                    * gaussian_filter(bin2heat[j].shape,
-                                                      center_y * bin2heat[j].shape[0],
-                                                      center_x * bin2heat[j].shape[1],
-                                                      img_area / bin2heat[j].shape[0] * bin2heat[j].shape[1])
-                                    * zero_mask(bin2heat[j].shape, get_effect_area(j)),
-                                    (img_width, img_height))
-                         for j in xrange(len(score))])
+    superposition = _superpose(layout, heat_maps, bins, w / w_sum, center_y, center_x, img_height, img_width)
 
     thresh = min(np.median(superposition), np.mean(superposition))
     val_range = superposition.max() - superposition.min()
@@ -261,10 +381,11 @@ def locate(scaled_img,
         print 'Saving to:', os.path.join(vis_img_dir, 'final.jpg')
         cv2.imwrite(os.path.join(vis_img_dir, 'final.jpg'), canvas)
 
-    cv2.destroyWindow("heat")
-    cv2.destroyWindow("img")
+    if display:
+        cv2.destroyWindow("heat")
+        cv2.destroyWindow("img")
 
-    return superposition, np.array(centroids[:expected_num_centroids])
+    return superposition, np.array(centroids[:expected_num_centroids]).reshape(-1, 3)
 
 
 def test_localization(net,
@@ -273,9 +394,18 @@ def test_localization(net,
                       pos_ave, neg_ave, dweight,
                       attr_id=-1,
                       display=True,
-                      max_count=-1):
-    """Test localization of a WPAL Network."""
+                      max_count=-1,
+                      cache=None,
+                      store=None,
+                      index=None):
+    """Test localization of a WPAL Network.
+    A ForwardCache can be given to reuse the results of images already passed
+    through the network, e.g. when localizing one attribute after another.
+    Images found in a FeatureStore, if given, are not passed through the
+    network at all. index is the binding index passed to locate.
+    """
 
+    max_area = cfg.TEST.MAX_AREA
     cfg.TEST.MAX_AREA = cfg.TEST.MAX_AREA * 7 / 8
 
     num_images = len(db.test_ind)
@@ -292,6 +422,8 @@ def test_localization(net,
         attr_list = []
         attr_list.append(attr_id)
 
+    recog = recognize_attr if cache is None else cache.recognize_attr
+
     cnt = 0
     for img_ind in db.test_ind:
         img_path = db.get_img_path(img_ind)
@@ -305,19 +437,27 @@ def test_localization(net,
         img = cv2.imread(img_path)
         print img.shape[0], img.shape[1]
 
-        # pass the image throught the test net.
-        try:
-            attr, heat_maps, score, img_scale = recognize_attr(net,
-                                                               img,
-                                                               db.attr_group,
-                                                               threshold,
-                                                               neglect=False)
-        except ResizedImageTooLargeException:
-            print 'Skipped for too large resized image.'
-            continue
-        except ResizedSideTooShortException:
-            print 'Skipped for too short side.'
-            continue
+        if store is not None and img_ind in store:
+            # read the outputs of the test net stored in advance.
+            attr = np.array(store.get(img_ind, 'pred'), dtype=np.float32)
+            discretize(attr, threshold)
+            heat_maps = [np.array(store.get(img_ind, x), dtype=np.float32) for x in HEAT_BLOBS]
+            score = np.array(store.get(img_ind, 'score'), dtype=np.float32)
+            img_scale = store.img_scale(img_ind)
+        else:
+            # pass the image throught the test net.
+            try:
+                attr, heat_maps, score, img_scale = recog(net,
+                                                          img,
+                                                          db.attr_group,
+                                                          threshold,
+                                                          neglect=False)
+            except ResizedImageTooLargeException:
+                print 'Skipped for too large resized image.'
+                continue
+            except ResizedSideTooShortException:
+                print 'Skipped for too short side.'
+                continue
 
         if attr_id != -1 and attr[attr_id] != 1:
             print 'Image {} skipped for failing to be recognized attribute {} from!' \
@@ -346,9 +486,10 @@ def test_localization(net,
                                         db,
                                         attr, heat_maps, score,
                                         display and attr_id != -1,
-                                        vis_img_dir)
+                                        vis_img_dir,
+                                        index)
             if attr_id == -1:
-                all_centroids += centroids
+                all_centroids.extend(centroids)
                 total_superposition += act_map * 256 / len(attr_list)
             print 'Localized attribute {}: {}!'.format(a, db.attr_eng[a][0][0])
 
@@ -392,13 +533,17 @@ def test_localization(net,
         if cnt >= max_count:
             break
 
+    # Restore the area limit, so that repeated calls see the same images.
+    cfg.TEST.MAX_AREA = max_area
+
 
 def locate_in_video(net,
                     db,
                     video_path, tracking_res_path,
                     output_dir,
                     pos_ave, neg_ave, dweight,
-                    attr_id_list):
+                    attr_id_list,
+                    index=None):
     """Locate attributes of pedestrians in a video using a WPAL-network.
     The tracking results should be provided in a text file.
     """
@@ -460,6 +605,7 @@ def locate_in_video(net,
                         thickness=3)
 
         has_pedestrian = False
+        crops = []
         for tracklet in tracklets:
             if tracklet['start_frame_ind'] \
                     <= frame_cnt \
@@ -471,68 +617,68 @@ def locate_in_video(net,
 
                 cropped = frame[bbox[1]: bbox[1] + bbox[3], bbox[0]: bbox[0] + bbox[2]]
 
-                # pass the image throught the test net.
+                # prepare the image for the test net.
                 try:
-                    attr, heat_maps, score, img_scale = recognize_attr(net,
-                                                                       cropped,
-                                                                       db.attr_group,
-                                                                       threshold,
-                                                                       neglect=False)
+                    crops.append((bbox, cropped, prep_image(cropped, neglect=False)))
                 except ResizedSideTooShortException:
                     print 'Skipped for too short side.'
-                    continue
 
-                msg = ''
-                for i in xrange(len(attr_ids)):
-                    if attr[attr_ids[i]] == 1:
-                        msg += db.attr_eng[attr_ids[i]][0][0] + ' '
-                print 'Recognized {}from Frame {}'.format(msg, frame_cnt)
-                msg = ''
-                for i in xrange(len(attr)):
-                    if attr[i] == 1 and not attr_ids.__contains__(i):
-                        msg += db.attr_eng[i][0][0] + ' '
-                print 'Unshown attributes: ' + msg
-
-                cv2.imshow("cropped", cropped)
-                cv2.waitKey(1)
-
-                cropped_height = int(cropped.shape[0] * img_scale)
-                cropped_width = int(cropped.shape[1] * img_scale)
-                cropped = cv2.resize(cropped, (cropped_width, cropped_height))
-
-                for i in xrange(len(attr_ids)):
-                    attr_id = attr_ids[i]
-                    if attr[attr_id] != 1:
-                        continue
-                    act_map, centroids = locate(cropped, pos_ave, neg_ave, dweight, attr_id, db,
-                                                      attr, heat_maps, score, display=False)
-                    act_map = cv2.resize(act_map, (bbox[2], bbox[3]))
-                    for x in xrange(bbox[2]):
-                        for y in xrange(bbox[3]):
-                            fx = x + bbox[0]
-                            fy = y + bbox[1]
-                            canvas[fy][fx][0] = np.uint8(min(255, canvas[fy][fx][0]
-                                                             + max(0, act_map[y][x]) * colors[i][0]))
-                            canvas[fy][fx][1] = np.uint8(min(255, canvas[fy][fx][1]
-                                                             + max(0, act_map[y][x]) * colors[i][1]))
-                            canvas[fy][fx][2] = np.uint8(min(255, canvas[fy][fx][2]
-                                                             + max(0, act_map[y][x]) * colors[i][2]))
-                    centroids = centroids[:, :2] / img_scale + (bbox[0], bbox[1])
-                    cross_len = math.sqrt(frame.shape[0] * frame.shape[1]) * 0.02
-
-                    thickness = len(centroids) * 2
-                    for c in centroids:
-                        cv2.line(canvas,
-                                 (int(c[0] - cross_len), int(c[1])),
-                                 (int(c[0] + cross_len), int(c[1])),
-                                 colors[i],
-                                 thickness=thickness)
-                        cv2.line(canvas,
-                                 (int(c[0]), int(c[1] - cross_len)),
-                                 (int(c[0]), int(c[1] + cross_len)),
-                                 colors[i],
-                                 thickness=thickness)
-                        thickness -= 2
+        # pass the pedestrians in the frame through the test net, those of
+        # the same shape at once, as padding would change their results.
+        results = recognize_same_shape(net, [x[2] for x in crops], db.attr_group, threshold)
+
+        for (bbox, cropped, _), (attr, heat_maps, score, img_scale, _) in zip(crops, results):
+            msg = ''
+            for i in xrange(len(attr_ids)):
+                if attr[attr_ids[i]] == 1:
+                    msg += db.attr_eng[attr_ids[i]][0][0] + ' '
+            print 'Recognized {}from Frame {}'.format(msg, frame_cnt)
+            msg = ''
+            for i in xrange(len(attr)):
+                if attr[i] == 1 and not attr_ids.__contains__(i):
+                    msg += db.attr_eng[i][0][0] + ' '
+            print 'Unshown attributes: ' + msg
+
+            cv2.imshow("cropped", cropped)
+            cv2.waitKey(1)
+
+            cropped_height = int(cropped.shape[0] * img_scale)
+            cropped_width = int(cropped.shape[1] * img_scale)
+            cropped = cv2.resize(cropped, (cropped_width, cropped_height))
+
+            for i in xrange(len(attr_ids)):
+                attr_id = attr_ids[i]
+                if attr[attr_id] != 1:
+                    continue
+                act_map, centroids = locate(cropped, pos_ave, neg_ave, dweight, attr_id, db,
+                                            attr, heat_maps, score, display=False, index=index)
+                act_map = cv2.resize(act_map, (bbox[2], bbox[3]))
+                for x in xrange(bbox[2]):
+                    for y in xrange(bbox[3]):
+                        fx = x + bbox[0]
+                        fy = y + bbox[1]
+                        canvas[fy][fx][0] = np.uint8(min(255, canvas[fy][fx][0]
+                                                         + max(0, act_map[y][x]) * colors[i][0]))
+                        canvas[fy][fx][1] = np.uint8(min(255, canvas[fy][fx][1]
+                                                         + max(0, act_map[y][x]) * colors[i][1]))
+                        canvas[fy][fx][2] = np.uint8(min(255, canvas[fy][fx][2]
+                                                         + max(0, act_map[y][x]) * colors[i][2]))
+                centroids = centroids[:, :2] / img_scale + (bbox[0], bbox[1])
+                cross_len = math.sqrt(frame.shape[0] * frame.shape[1]) * 0.02
+
+                thickness = len(centroids) * 2
+                for c in centroids:
+                    cv2.line(canvas,
+                             (int(c[0] - cross_len), int(c[1])),
+                             (int(c[0] + cross_len), int(c[1])),
+                             colors[i],
+                             thickness=thickness)
+                    cv2.line(canvas,
+                             (int(c[0]), int(c[1] - cross_len)),
+                             (int(c[0]), int(c[1] + cross_len)),
+                             colors[i],
+                             thickness=thickness)
+                    thickness -= 2
 
         if has_pedestrian:
             if writer is None:
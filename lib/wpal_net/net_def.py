@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Rewrite network definitions, compacted for deployment."""
+
+import numpy as np
+
+from caffe.proto import caffe_pb2
+from google.protobuf import text_format
+
+
+def _producer(layers, blob, before):
+    """Return the index of the last layer before index before writing blob."""
+    for i in xrange(before - 1, -1, -1):
+        if blob in layers[i].top:
+            return i
+    return None
+
+
+def _rename_bottoms(layers, old, new):
+    for layer in layers:
+        for i in xrange(len(layer.bottom)):
+            if layer.bottom[i] == old:
+                layer.bottom[i] = new
+
+
+def _copy(n):
+    new = caffe_pb2.NetParameter()
+    new.CopyFrom(n)
+    return new
+
+
+def _with_layers(n, layers):
+    """Return a copy of the net definition n holding the given layers."""
+    new = _copy(n)
+    del new.layer[:]
+    new.layer.extend(layers)
+    return new
+
+
+def strip_layers(n, outputs):
+    """Remove the layers having no effect on the outputs at test time:
+    Dropout layers, layers of the TRAIN phase only and layers none of the
+    output blobs depends on. Returns a new net definition.
+    """
+    n = _copy(n)
+    layers = []
+    for layer in n.layer:
+        if any(rule.HasField('phase') and rule.phase == caffe_pb2.TRAIN for rule in layer.include):
+            continue
+        layers.append(layer)
+
+    kept = []
+    for i, layer in enumerate(layers):
+        if layer.type == 'Dropout':
+            if layer.top[0] != layer.bottom[0]:
+                _rename_bottoms(layers[i + 1:], layer.top[0], layer.bottom[0])
+            continue
+        kept.append(layer)
+
+    needed = set(outputs)
+    live = []
+    for layer in reversed(kept):
+        if len(set(layer.top) & needed) > 0:
+            live.append(layer)
+            needed |= set(layer.bottom)
+    live.reverse()
+
+    return _with_layers(n, live)
+
+
+def fold_batch_norm(n, params):
+    """Merge BatchNorm layers, and the Scale layers following them, into the
+    Convolution or InnerProduct layers they follow, updating params, the
+    dict of the parameter arrays of each layer. Returns a new net definition.
+    """
+    n = _copy(n)
+    layers = list(n.layer)
+    removed = set()
+    for i, layer in enumerate(layers):
+        if layer.type != 'BatchNorm':
+            continue
+        j = _producer(layers, layer.bottom[0], i)
+        if j is None or layers[j].type not in ('Convolution', 'InnerProduct'):
+            continue
+        prev = layers[j]
+        if any(layer.bottom[0] in x.bottom for x in layers[j + 1:i]):
+            # The output is used before being normalized.
+            continue
+
+        mean, var, factor = params[layer.name]
+        factor = 0 if factor[0] == 0 else 1.0 / factor[0]
+        mul = 1.0 / np.sqrt(var * factor + layer.batch_norm_param.eps)
+        add = -mean * factor * mul
+        removed.add(i)
+        top = layer.top[0]
+
+        # a Scale layer right after the BatchNorm layer
+        if i + 1 < len(layers) and layers[i + 1].type == 'Scale' and layers[i + 1].bottom[0] == top:
+            scale = layers[i + 1]
+            gamma = params[scale.name][0]
+            beta = params[scale.name][1] if scale.scale_param.bias_term else 0
+            mul, add = mul * gamma, add * gamma + beta
+            removed.add(i + 1)
+            top = scale.top[0]
+
+        if prev.type == 'Convolution':
+            layer_param = prev.convolution_param
+        else:
+            layer_param = prev.inner_product_param
+        weights = params[prev.name][0]
+        bias = params[prev.name][1] if layer_param.bias_term else np.zeros(weights.shape[0], dtype=weights.dtype)
+        layer_param.bias_term = True
+        params[prev.name] = [(weights * mul.reshape((-1,) + (1,) * (weights.ndim - 1))).astype(weights.dtype),
+                             (bias * mul + add).astype(weights.dtype)]
+
+        if top != prev.top[0]:
+            _rename_bottoms(layers[i + 1:], top, prev.top[0])
+
+    return _with_layers(n, [x for i, x in enumerate(layers) if i not in removed])
+
+
+def fold_mean(n, params, means, input_blob='data'):
+    """Fold the subtraction of the pixel means into the biases of the
+    Convolution layers reading the input, so that the net takes raw pixels.
+    Outputs are exactly the same except near the image borders, where the
+    convolutions pad raw input rather than mean-subtracted input with zeros.
+    Updates params and returns a new net definition.
+    """
+    new = _copy(n)
+    for layer in new.layer:
+        if input_blob not in layer.bottom:
+            continue
+        if layer.type != 'Convolution':
+            raise ValueError('Cannot fold the means into layer {} of type {}!'.format(layer.name, layer.type))
+
+        conv = layer.convolution_param
+        weights = params[layer.name][0]
+        bias = params[layer.name][1] if conv.bias_term else np.zeros(weights.shape[0], dtype=weights.dtype)
+        conv.bias_term = True
+
+        # Each output sees the means of the input channels of its group.
+        group_means = np.asarray(means, dtype=np.float64).reshape(conv.group, -1)
+        out_means = group_means[np.arange(weights.shape[0]) / (weights.shape[0] / conv.group)]
+        bias = bias - (weights.sum(axis=(2, 3)) * out_means).sum(axis=1)
+        params[layer.name] = [weights, bias.astype(weights.dtype)]
+    return new
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Read and prepare test images ahead of the network in background threads."""
+
+import collections
+from multiprocessing.pool import ThreadPool
+
+import cv2
+
+from config import cfg
+from recog import prep_image
+
+
+def _read_and_prep(img_path, neglect, prep):
+    img = cv2.imread(img_path)
+    if not prep:
+        return img, 1.0
+    return prep_image(img, neglect)
+
+
+def prefetch_images(db, inds, batch_size=None, num_threads=None, depth=None, neglect=False, prep=True):
+    """Iterate over images of a database in batches, while following images
+    are decoded and prepared by a pool of threads. At most depth images are
+    read ahead of the one being yielded, and batches are yielded in the order
+    of inds. Errors in preparing an image are raised when its batch is due.
+    Arguments:
+        db:                 the image database.
+        inds (list):        indexes of images in the database to iterate over.
+        batch_size (int):   number of images per batch. Defaults to
+                            cfg.TEST.BATCH_SIZE.
+        num_threads (int):  number of threads. Defaults to
+                            cfg.TEST.PREFETCH_THREADS.
+        depth (int):        max number of images read ahead. Defaults to
+                            cfg.TEST.PREFETCH_DEPTH.
+        neglect (bool):     passed to prep_image.
+        prep (bool):        whether to prepare the images, or only read them
+                            and pair them with a scale of 1.
+    Yields:
+        batch_inds (list):  indexes of the images in the batch.
+        prepped (list):     (img, img_scale) pairs returned by prep_image.
+    """
+    if batch_size is None:
+        batch_size = cfg.TEST.BATCH_SIZE
+    if num_threads is None:
+        num_threads = cfg.TEST.PREFETCH_THREADS
+    if depth is None:
+        depth = max(cfg.TEST.PREFETCH_DEPTH, batch_size)
+
+    pool = ThreadPool(num_threads)
+    try:
+        pending = collections.deque()
+        batch_inds = []
+        prepped = []
+        next_ind = 0
+        while next_ind < len(inds) or len(pending) > 0:
+            while next_ind < len(inds) and len(pending) < depth:
+                i = inds[next_ind]
+                pending.append((i, pool.apply_async(_read_and_prep, (db.get_img_path(i), neglect, prep))))
+                next_ind += 1
+
+            i, res = pending.popleft()
+            batch_inds.append(i)
+            prepped.append(res.get())
+            if len(prepped) == batch_size:
+                yield batch_inds, prepped
+                batch_inds = []
+                prepped = []
+
+        if len(prepped) > 0:
+            yield batch_inds, prepped
+    finally:
+        pool.terminate()
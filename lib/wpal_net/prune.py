@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Prune the detectors of a WPAL Network bound to no attribute."""
+
+import math
+
+import numpy as np
+
+from loc import _levels
+from net_def import _copy
+
+
+# Layers passing the channels of their input through unchanged in number
+_CHANNEL_WISE = ('ReLU', 'Pooling', 'SPP', 'Dropout')
+
+
+def _bins_of(keep, num_detector, levels, offset=0):
+    """Return the indexes of the bins of the kept detectors of a layer, whose
+    bins start at offset, laid out level by level and detector by detector
+    within a level.
+    """
+    bins = []
+    for level in levels:
+        size = level[0] * level[1]
+        ind = np.arange(offset, offset + num_detector * size).reshape(num_detector, size)
+        bins.append(ind[keep].ravel())
+        offset += num_detector * size
+    return np.concatenate(bins)
+
+
+def select_detectors(binding, loc_layers, keep_ratio):
+    """Rank the detectors of each layer by their maximum binding across
+    attributes and bins, and keep the given ratio of the best ones.
+    Returns the sorted indexes of the kept detectors of each layer.
+    """
+    binding = np.asarray(binding)
+    keeps = []
+    offset = 0
+    for layer in loc_layers:
+        num_detector = layer.NUM_DETECTOR
+        strength = np.zeros(num_detector)
+        for level in _levels(layer):
+            size = num_detector * level[0] * level[1]
+            level_binding = binding[:, offset:offset + size].reshape(binding.shape[0], num_detector, -1)
+            strength = np.maximum(strength, level_binding.max(axis=(0, 2)))
+            offset += size
+        num_keep = max(1, int(math.ceil(num_detector * keep_ratio)))
+        keeps.append(np.sort(np.argsort(-strength, kind='mergesort')[:num_keep]))
+    if offset != binding.shape[1]:
+        raise ValueError('Bin layout of cfg.LOC.LAYERS does not match the {} bins of the binding!'
+                         .format(binding.shape[1]))
+    return keeps
+
+
+def kept_bins(loc_layers, keeps):
+    """Return the indexes of the bins of the kept detectors among all bins."""
+    bins = []
+    offset = 0
+    for layer, keep in zip(loc_layers, keeps):
+        bins.append(_bins_of(keep, layer.NUM_DETECTOR, _levels(layer), offset))
+        offset += layer.NUM_DETECTOR * sum(level[0] * level[1] for level in _levels(layer))
+    return np.concatenate(bins)
+
+
+def prune_net(n, params, loc_layers, keeps):
+    """Remove the pruned detectors from the convolution layers named in
+    loc_layers, and their inputs from the layers reading them: the input
+    columns of inner product layers after pooling, and the input channels of
+    convolution layers. Updates params and returns a new net definition.
+    """
+    n = _copy(n)
+    layers = list(n.layer)
+    names = [x.name for x in layers]
+    for loc_layer, keep in zip(loc_layers, keeps):
+        i = names.index(loc_layer.NAME)
+        conv = layers[i]
+        conv.convolution_param.num_output = len(keep)
+        params[conv.name] = [x[keep] for x in params[conv.name]]
+
+        # Follow the channels of the detectors through the net.
+        derived = set(conv.top)
+        for layer in layers[i + 1:]:
+            if len(set(layer.bottom) & derived) == 0:
+                continue
+            if layer.type in _CHANNEL_WISE or (layer.type == 'Concat' and len(layer.bottom) == 1):
+                derived |= set(layer.top)
+            elif layer.type == 'InnerProduct':
+                weights = params[layer.name][0]
+                cols = _bins_of(keep, loc_layer.NUM_DETECTOR, _levels(loc_layer))
+                if weights.shape[1] != loc_layer.NUM_DETECTOR * len(cols) / len(keep):
+                    raise ValueError('Inputs of layer {} do not match the bin layout of {}!'
+                                     .format(layer.name, conv.name))
+                params[layer.name] = [weights[:, cols]] + params[layer.name][1:]
+            elif layer.type == 'Convolution':
+                params[layer.name] = [params[layer.name][0][:, keep]] + params[layer.name][1:]
+            elif layer.type != 'Concat':
+                raise ValueError('Cannot prune the inputs of layer {} of type {}!'.format(layer.name, layer.type))
+    return n
@@ -1,12 +1,19 @@
+import collections
 import math
 
 import cv2
 import numpy as np
-from utils.blob import img_list_to_blob
 
 from config import cfg
 
 
+# Outputs recognize_attr is able to compute
+ALL_OUTPUTS = ('pred', 'score', 'heat')
+
+# Blobs holding the heat maps of the localization layers
+HEAT_BLOBS = ['heat3', 'heat4', 'heat5']
+
+
 class ResizedImageTooLargeException(Exception):
     pass
 
@@ -15,24 +22,13 @@ class ResizedSideTooShortException(Exception):
     pass
 
 
-def _get_image_blob(img, neglect):
-    """Converts an image into a network input.
-    Arguments:
-        img (ndarray): a color image in BGR order
-    Returns:
-        blob (ndarray): a data blob holding the image
-        img_scale (double): image scale (relative to img) used
-    """
-    img_orig = img.astype(np.float32, copy=True)
-    img_orig -= cfg.PIXEL_MEANS
-
-    img_shape = img_orig.shape
+def _get_image_scale(img_shape, neglect, target_size=None):
+    """Compute the scale to resize an image of given shape with for testing."""
     img_size_min = np.min(img_shape[0:2])
     img_size_max = np.max(img_shape[0:2])
 
-    processed_images = []
-
-    target_size = cfg.TEST.SCALE
+    if target_size is None:
+        target_size = cfg.TEST.SCALE
     img_scale = float(target_size) / float(img_size_max)
 
     # Prevent the shorter sides from being less than MIN_SIZE
@@ -48,21 +44,119 @@ def _get_image_blob(img, neglect):
     if img_scale * img_size_min < 64:
         raise ResizedSideTooShortException
 
-    img = cv2.resize(img_orig, None, None, fx=img_scale, fy=img_scale,
+    return img_scale
+
+
+def _find_bucket(h, w):
+    """Return the smallest bucket able to hold an image of given size,
+    or None if there is no such bucket.
+    """
+    fits = [b for b in cfg.TEST.BUCKETS if b[0] >= h and b[1] >= w]
+    if len(fits) == 0:
+        return None
+    return min(fits, key=lambda b: b[0] * b[1])
+
+
+def prep_image(img, neglect=False, target_size=None):
+    """Prepare an image to be put into a network input blob.
+    The image is scaled in its original 8-bit form, leaving mean subtraction
+    to be done when it is written into the blob.
+    Arguments:
+        img (ndarray):      a color image in BGR order
+        neglect (bool):     whether to refuse the image if it becomes too
+                            large after being scaled to the expected size.
+        target_size (int):  expected length of the longer side. Defaults to
+                            cfg.TEST.SCALE.
+    Returns:
+        img (ndarray):      the scaled image
+        img_scale (double): image scale (relative to img) used
+    """
+    img_scale = _get_image_scale(img.shape, neglect, target_size)
+
+    if len(cfg.TEST.BUCKETS) > 0:
+        h = int(round(img.shape[0] * img_scale))
+        w = int(round(img.shape[1] * img_scale))
+        if _find_bucket(h, w) is None:
+            # Shrink the image to fit in the largest bucket.
+            bucket = max(cfg.TEST.BUCKETS, key=lambda b: b[0] * b[1])
+            img_scale = min(float(bucket[0]) / img.shape[0], float(bucket[1]) / img.shape[1])
+            h = min(bucket[0], int(round(img.shape[0] * img_scale)))
+            w = min(bucket[1], int(round(img.shape[1] * img_scale)))
+            if min(h, w) < 64:
+                raise ResizedSideTooShortException
+        img = cv2.resize(img, (w, h), interpolation=cv2.INTER_LINEAR)
+        return img, img_scale
+
+    img = cv2.resize(img, None, None, fx=img_scale, fy=img_scale,
                      interpolation=cv2.INTER_LINEAR)
-    processed_images.append(img)
+    return img, img_scale
 
-    # Create a blob to hold the input images
-    blob = img_list_to_blob(processed_images)
 
-    return blob, img_scale
+def _blob_shape(imgs):
+    """Return the shape of the blob to hold the prepared images."""
+    max_shape = np.array([img.shape for img in imgs]).max(axis=0)
+    bucket = _find_bucket(max_shape[0], max_shape[1])
+    if bucket is not None:
+        return len(imgs), 3, int(bucket[0]), int(bucket[1])
+    return len(imgs), 3, int(max_shape[0]), int(max_shape[1])
 
 
-def _get_blobs(img, neglect):
-    """Convert an image into network inputs."""
-    blobs = {'data': None}
-    blobs['data'], img_scale_factor = _get_image_blob(img, neglect)
-    return blobs, img_scale_factor
+def _fill_blob(blob, imgs, edge_pad=False):
+    """Write prepared images into a blob of shape (N, 3, H, W).
+    Mean subtraction and reordering the channels to the front are done in a
+    single pass for each channel, or the pixels are only cast if
+    cfg.TEST.RAW_INPUT is set. The blob is padded outside images with zeros
+    (the mean pixel for raw input), or by replicating the edges of the images
+    if edge_pad is set.
+    """
+    means = cfg.PIXEL_MEANS.ravel()
+    raw = cfg.TEST.RAW_INPUT
+    pad = means.reshape(3, 1, 1) if raw else 0
+    for n in xrange(len(imgs)):
+        img = imgs[n]
+        h, w = img.shape[0:2]
+        for c in xrange(3):
+            if raw:
+                blob[n, c, :h, :w] = img[:, :, c]
+            else:
+                np.subtract(img[:, :, c], means[c], out=blob[n, c, :h, :w], dtype=np.float32)
+        if edge_pad:
+            blob[n, :, :h, w:] = blob[n, :, :h, w - 1:w]
+            blob[n, :, h:, :] = blob[n, :, h - 1:h, :]
+        else:
+            blob[n, :, h:, :] = pad
+            blob[n, :, :h, w:] = pad
+
+
+def _load_data_blob(net, imgs):
+    """Write prepared images straight into the data blob of the net,
+    reshaping the blob only when its shape changes.
+    """
+    shape = _blob_shape(imgs)
+    if net.blobs['data'].data.shape != shape:
+        net.blobs['data'].reshape(*shape)
+    _fill_blob(net.blobs['data'].data, imgs, edge_pad=len(cfg.TEST.BUCKETS) > 0)
+    return shape
+
+
+def warm_up(net, batch_sizes=None):
+    """Pass the net once through every bucket shape, so that no memory is
+    allocated for reshaping at steady state. Does nothing if no buckets are
+    configured.
+    Arguments:
+        net (caffe.Net):    WPAL network to warm up.
+        batch_sizes (list): batch sizes to warm up with. Defaults to 1 and
+                            cfg.TEST.BATCH_SIZE.
+    """
+    if batch_sizes is None:
+        batch_sizes = sorted(set([1, cfg.TEST.BATCH_SIZE]))
+
+    for bucket in sorted(cfg.TEST.BUCKETS, key=lambda b: b[0] * b[1]):
+        for batch_size in batch_sizes:
+            net.blobs['data'].reshape(batch_size, 3, int(bucket[0]), int(bucket[1]))
+            net.blobs['data'].data[...] = 0
+            net.forward()
+        print 'Warmed up on bucket {}x{}'.format(bucket[0], bucket[1])
 
 
 def _attr_group_norm(pred, group):
@@ -76,7 +170,25 @@ def discretize(attr, threshold):
         attr[i] = 0 if attr[i] < threshold[i] else 1
 
 
-def recognize_attr(net, img, attr_group, threshold=None, neglect=False):
+def _valid_shape(map_shape, img_shape, blob_shape):
+    """Return the height and width of the part of a map (such as a heat map)
+    covering the image, when the image is padded into a larger blob.
+    """
+    h = int(math.ceil(float(map_shape[0]) * img_shape[0] / blob_shape[0]))
+    w = int(math.ceil(float(map_shape[1]) * img_shape[1] / blob_shape[1]))
+    return min(h, map_shape[0]), min(w, map_shape[1])
+
+
+def _last_layer(net, blob_names):
+    """Return the name of the last layer producing any of the given blobs."""
+    last = None
+    for name in net._layer_names:
+        if len(set(net.top_names[name]) & set(blob_names)) > 0:
+            last = name
+    return last
+
+
+def recognize_attr(net, img, attr_group, threshold=None, neglect=False, outputs=ALL_OUTPUTS):
     """Recognize attributes in a pedestrian image.
     Arguments:
         net (caffe.Net):            WPAL network to use.
@@ -87,31 +199,243 @@ def recognize_attr(net, img, attr_group, threshold=None, neglect=False):
         neglect (bool):             Whether to neglect the image if when it is
                                     adjusted to have expected longest side
                                     length, its size becomes larger than limit.
+        outputs (tuple):            Outputs to compute, among 'pred', 'score'
+                                    and 'heat'. Outputs not asked for are
+                                    returned as None.
+    Returns:
+        pred (ndarray):         K x 1 array of predicted attributes. (K is
+                                specified by database or the net)
+        heat_maps (list):       heat maps of each localization layer, stacked
+                                in one (C, H, W) array per layer.
+        score (ndarray):        1-D array of detector bin scores.
+        img_scale (double):     image scale (relative to img) used
+    """
+    pred, heat_maps, score, img_scale, _ = \
+        recognize_prepped(net, [prep_image(img, neglect)], attr_group, threshold, outputs)[0]
+
+    return pred, heat_maps, score, img_scale
+
+
+def recognize_prepped(net, prepped, attr_group, threshold=None, outputs=ALL_OUTPUTS):
+    """Recognize attributes in a batch of images already prepared by
+    prep_image, using one forward pass of the network. The forward stops at
+    the last layer needed by the outputs asked for.
+    Arguments:
+        net (caffe.Net):            WPAL network to use.
+        prepped (list of tuples):   (img, img_scale) pairs returned by
+                                    prep_image.
+        attr_group(list of ranges): A list of ranges, each contains indexes of
+                                    attributes mutually excluding each other.
+        threshold (array):          Threshold for judging labels from scores.
+        outputs (tuple):            Outputs to compute, among 'pred', 'score'
+                                    and 'heat'.
     Returns:
-        attributes (ndarray): K x 1 array of predicted attributes. (K is
-            specified by database or the net)
+        A list holding a (pred, heat_maps, score, img_scale, mask) tuple for
+        each image. The heat maps are cropped to the part covering the image,
+        and mask is a boolean map of the input blob marking the pixels
+        belonging to the image but not padding. Predictions and scores are
+        pooled by the net over the whole padded blob, so they may differ from
+        those of the image tested alone unless all images have the same shape.
     """
-    blobs, img_scale = _get_blobs(img, neglect)
+    imgs = [x[0] for x in prepped]
+    blob_shape = _load_data_blob(net, imgs)
 
-    # reshape network inputs
-    net.blobs['data'].reshape(*(blobs['data'].shape))
+    blob_names = [x for x in outputs if x != 'heat']
+    if 'heat' in outputs:
+        blob_names += HEAT_BLOBS
+    net.forward(end=_last_layer(net, blob_names))
 
-    forward_kwargs = {'data': blobs['data'].astype(np.float32, copy=False)}
-    blobs_out = net.forward(**forward_kwargs)
+    results = []
+    for n in xrange(len(prepped)):
+        img_shape = imgs[n].shape
+        mask = np.zeros(blob_shape[2:], dtype=bool)
+        mask[:img_shape[0], :img_shape[1]] = True
 
-    pred = np.average(blobs_out['pred'], axis=0)
-    heat3 = np.average(blobs_out['heat3'], axis=0)
-    heat4 = np.average(blobs_out['heat4'], axis=0)
-    heat5 = np.average(blobs_out['heat5'], axis=0)
-    score = np.average(blobs_out['score'], axis=0)
+        pred = None
+        if 'pred' in outputs:
+            pred = net.blobs['pred'].data[n].copy()
 
-    for group in attr_group:
-        pred = _attr_group_norm(pred, group)
+            for group in attr_group:
+                pred = _attr_group_norm(pred, group)
 
-    if threshold is not None:
-        for i in xrange(pred.shape[0]):
-            pred[i] = 0 if pred[i] < threshold[i] else 1
+            if threshold is not None:
+                discretize(pred, threshold)
 
-    heat_maps = [x for x in heat3] + [x for x in heat4] + [x for x in heat5]
+        score = None
+        if 'score' in outputs:
+            score = net.blobs['score'].data[n].flatten()
 
-    return pred, heat_maps, score, img_scale
+        heat_maps = None
+        if 'heat' in outputs:
+            heat_maps = []
+            for name in HEAT_BLOBS:
+                heat = net.blobs[name].data[n]
+                h, w = _valid_shape(heat.shape[1:], img_shape, blob_shape[2:])
+                heat_maps.append(heat[:, :h, :w].copy())
+
+        results.append((pred, heat_maps, score, prepped[n][1], mask))
+
+    return results
+
+
+def recognize_same_shape(net, prepped, attr_group, threshold=None, outputs=ALL_OUTPUTS, max_batch=None):
+    """Recognize attributes in images prepared by prep_image, passing only
+    images of the same shape through the network together, so that no image
+    is padded and the results are those of each image tested alone.
+    Arguments:
+        max_batch (int):    max number of images in a forward. Defaults to
+                            no limit.
+        Others are as recognize_prepped.
+    Returns:
+        A list of the results of recognize_prepped, in the order of prepped.
+    """
+    groups = collections.OrderedDict()
+    for i in xrange(len(prepped)):
+        groups.setdefault(prepped[i][0].shape, []).append(i)
+
+    results = [None] * len(prepped)
+    for inds in groups.itervalues():
+        step = max_batch if max_batch is not None else len(inds)
+        for k in xrange(0, len(inds), step):
+            batch = inds[k:k + step]
+            for i, res in zip(batch, recognize_prepped(net, [prepped[i] for i in batch],
+                                                       attr_group, threshold, outputs)):
+                results[i] = res
+    return results
+
+
+def recognize_attr_batch(net, imgs, attr_group, threshold=None, neglect=False, outputs=ALL_OUTPUTS):
+    """Recognize attributes in a batch of pedestrian images using one forward
+    pass of the network.
+    Arguments:
+        net (caffe.Net):            WPAL network to use.
+        imgs (list of ndarray):     Color images to test (in BGR order)
+        attr_group(list of ranges): A list of ranges, each contains indexes of
+                                    attributes mutually excluding each other.
+        threshold (array):          Threshold for judging labels from scores.
+        neglect (bool):             Whether to neglect the images if when they
+                                    are adjusted to have expected longest side
+                                    length, their sizes become larger than
+                                    limit.
+        outputs (tuple):            Outputs to compute, among 'pred', 'score'
+                                    and 'heat'.
+    Returns:
+        A list holding a (pred, heat_maps, score, img_scale, mask) tuple for
+        each image. See recognize_prepped.
+    """
+    prepped = [prep_image(img, neglect) for img in imgs]
+    return recognize_prepped(net, prepped, attr_group, threshold, outputs)
+
+
+def _flip_bin_perm(num_bins):
+    """Return the permutation mapping detector bins of a horizontally-flipped
+    image back to those of the original image, following the bin layout in
+    cfg.LOC.LAYERS. Bins are assumed to be globally pooled (thus unaffected by
+    flipping) if the layout does not match the number of bins.
+    """
+    from loc import _levels
+
+    perm = []
+    offset = 0
+    for layer in cfg.LOC.LAYERS:
+        for level in _levels(layer):
+            size = layer.NUM_DETECTOR * level[0] * level[1]
+            ind = np.arange(offset, offset + size).reshape(layer.NUM_DETECTOR, level[0], level[1])
+            perm.append(ind[:, :, ::-1].ravel())
+            offset += size
+    if offset != num_bins:
+        return np.arange(num_bins)
+    return np.concatenate(perm)
+
+
+def _interp_matrix(len_out, len_in):
+    """Return the matrix of linear interpolation resizing a vector of length
+    len_in to len_out, sampling the same way as cv2.resize.
+    """
+    pos = (np.arange(len_out) + 0.5) * len_in / float(len_out) - 0.5
+    pos = np.clip(pos, 0, len_in - 1)
+    low = np.floor(pos).astype(int)
+    high = np.minimum(low + 1, len_in - 1)
+    frac = (pos - low).astype(np.float32)
+    mat = np.zeros((len_out, len_in), dtype=np.float32)
+    mat[np.arange(len_out), low] += 1 - frac
+    mat[np.arange(len_out), high] += frac
+    return mat
+
+
+def _resize_maps(maps, shape):
+    """Resize a stack of maps of shape (C, H, W) to (C, shape[0], shape[1])."""
+    if maps.shape[1:] == tuple(shape):
+        return maps
+    maps = np.matmul(_interp_matrix(shape[0], maps.shape[1]), maps)
+    return np.matmul(maps, _interp_matrix(shape[1], maps.shape[2]).T)
+
+
+def recognize_attr_tta(net, img, attr_group, threshold=None, neglect=False, outputs=ALL_OUTPUTS,
+                       scales=None, flip=None):
+    """Recognize attributes in a pedestrian image with test-time augmentation.
+    All the variants of the image, at each scale and optionally flipped, are
+    packed into one batch and passed through the net in a single forward.
+    Predictions, scores and heat maps are averaged over the variants, after
+    the scores and heat maps of flipped variants are flipped back.
+    Arguments:
+        net (caffe.Net):            WPAL network to use.
+        img (ndarray):              Color image to test (in BGR order)
+        attr_group(list of ranges): A list of ranges, each contains indexes of
+                                    attributes mutually excluding each other.
+        threshold (array):          Threshold for judging labels from scores.
+        neglect (bool):             Whether to neglect the image if its size
+                                    becomes larger than limit when scaled.
+        outputs (tuple):            Outputs to compute, among 'pred', 'score'
+                                    and 'heat'.
+        scales (list):              Scales of the variants. Defaults to
+                                    cfg.TEST.TTA_SCALES, or cfg.TEST.SCALE if
+                                    it is empty.
+        flip (bool):                Whether to add flipped variants. Defaults
+                                    to cfg.TEST.TTA_FLIP.
+    Returns:
+        The same as recognize_attr. Heat maps are given at the resolution of
+        the first scale, and so is img_scale.
+    """
+    if scales is None:
+        scales = cfg.TEST.TTA_SCALES if len(cfg.TEST.TTA_SCALES) > 0 else [cfg.TEST.SCALE]
+    if flip is None:
+        flip = cfg.TEST.TTA_FLIP
+
+    prepped = []
+    flipped = []
+    for scale in scales:
+        scaled, img_scale = prep_image(img, neglect, scale)
+        prepped.append((scaled, img_scale))
+        flipped.append(False)
+        if flip:
+            prepped.append((cv2.flip(scaled, 1), img_scale))
+            flipped.append(True)
+
+    results = recognize_prepped(net, prepped, [], None, outputs)
+    num_variants = len(results)
+
+    pred = None
+    if 'pred' in outputs:
+        pred = sum([x[0] for x in results]) / num_variants
+
+        for group in attr_group:
+            pred = _attr_group_norm(pred, group)
+
+        if threshold is not None:
+            discretize(pred, threshold)
+
+    score = None
+    if 'score' in outputs:
+        perm = _flip_bin_perm(len(results[0][2]))
+        score = sum([x[2][perm] if f else x[2] for x, f in zip(results, flipped)]) / num_variants
+
+    heat_maps = None
+    if 'heat' in outputs:
+        heat_maps = []
+        for i in xrange(len(HEAT_BLOBS)):
+            shape = results[0][1][i].shape[1:]
+            heat_maps.append(sum([_resize_maps(x[1][i][:, :, ::-1] if f else x[1][i], shape)
+                                  for x, f in zip(results, flipped)]) / num_variants)
+
+    return pred, heat_maps, score, prepped[0][1]
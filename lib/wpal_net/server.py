@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Serve attribute recognition of a WPAL Network over HTTP, on localhost or a
+Unix socket. Images posted concurrently are collected into micro-batches and
+passed through the network together.
+"""
+
+import BaseHTTPServer
+import collections
+import json
+import os
+import Queue
+import SocketServer
+import socket
+import threading
+import time
+import traceback
+import urlparse
+
+import cv2
+import numpy as np
+
+from config import cfg
+from loc import locate
+from recog import recognize_prepped, prep_image, ALL_OUTPUTS, \
+    ResizedImageTooLargeException, ResizedSideTooShortException
+
+
+class ServerBusyException(Exception):
+    pass
+
+
+class _Request(object):
+    """An image waiting in the queue of a MicroBatcher, and its result."""
+
+    def __init__(self, prepped, want_heat):
+        self.prepped = prepped
+        self.want_heat = want_heat
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher(object):
+    """Pass images submitted by concurrent threads through a network in
+    batches, on a thread of its own owning the network.
+    Only images of the same prepared shape share a batch, as pooling runs
+    over the padding of smaller images. A batch is closed once it is full, or
+    max_wait seconds after its first image arrived. At most max_queue images
+    wait in the queue, besides up to max_batch of other shapes set aside for
+    later batches; further ones are refused with ServerBusyException.
+    """
+
+    def __init__(self, net, attr_group, threshold,
+                 max_batch=None, max_wait=0.01, max_queue=256, gpu_id=-1):
+        self.net = net
+        self.attr_group = attr_group
+        self.threshold = threshold
+        self.max_batch = max_batch if max_batch is not None else cfg.TEST.SERVE_BATCH_SIZE
+        self.max_wait = max_wait
+        self.gpu_id = gpu_id
+
+        self.num_batches = 0
+        self.num_images = 0
+        self.num_refused = 0
+
+        self._queue = Queue.Queue(max_queue)
+        # Requests taken from the queue which did not fit in the last batch
+        self._pending = collections.deque()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, prepped, want_heat=False):
+        """Wait for the result of an image prepared by prep_image, as an item
+        returned by recognize_prepped. Heat maps and scores are computed only
+        if want_heat is set.
+        """
+        request = _Request(prepped, want_heat)
+        try:
+            self._queue.put_nowait(request)
+        except Queue.Full:
+            self.num_refused += 1
+            raise ServerBusyException()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stats(self):
+        return {'batches': self.num_batches,
+                'images': self.num_images,
+                'refused': self.num_refused,
+                'queued': self._queue.qsize() + len(self._pending)}
+
+    def _collect(self):
+        first = self._pending.popleft() if len(self._pending) > 0 else self._queue.get()
+        shape = first.prepped[0].shape
+        batch = [first]
+        others = collections.deque()
+        for request in self._pending:
+            if len(batch) < self.max_batch and request.prepped[0].shape == shape:
+                batch.append(request)
+            else:
+                others.append(request)
+        self._pending = others
+
+        # Requests of other shapes are set aside for later batches, up to a
+        # batch of them.
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch and len(self._pending) < self.max_batch:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except Queue.Empty:
+                break
+            if request.prepped[0].shape == shape:
+                batch.append(request)
+            else:
+                self._pending.append(request)
+        return batch
+
+    def _run(self):
+        if self.gpu_id != -1:
+            # The Caffe mode is kept per thread.
+            import caffe
+            caffe.set_mode_gpu()
+            caffe.set_device(self.gpu_id)
+
+        while True:
+            batch = self._collect()
+            outputs = ALL_OUTPUTS if any(x.want_heat for x in batch) else ('pred',)
+            try:
+                results = recognize_prepped(self.net, [x.prepped for x in batch],
+                                            self.attr_group, self.threshold, outputs=outputs)
+            except Exception as e:
+                results = [None] * len(batch)
+                for request in batch:
+                    request.error = e
+            for request, result in zip(batch, results):
+                request.result = result
+                request.done.set()
+            self.num_batches += 1
+            self.num_images += len(batch)
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer POST /recognize with the attributes of the image in the body.
+    The query may ask for localization with locate=<comma separated attribute
+    IDs>, or locate=all for all attributes recognized in the image.
+    GET /stats returns counters of the batcher.
+    """
+
+    def log_message(self, format, *args):
+        # Clients of a Unix socket have no address.
+        client = self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+        print '{} - {}'.format(client, format % args)
+
+    def _reply(self, code, content, headers=None):
+        body = json.dumps(content)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).iteritems():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_error(self, e):
+        """Reply with an unexpected error, logging its traceback."""
+        traceback.print_exc()
+        self._reply(500, {'error': 'Internal error: {}'.format(e)})
+
+    def do_GET(self):
+        if urlparse.urlparse(self.path).path != '/stats':
+            self._reply(404, {'error': 'Not found'})
+            return
+        self._reply(200, self.server.batcher.stats())
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        if url.path != '/recognize':
+            self._reply(404, {'error': 'Not found'})
+            return
+        query = urlparse.parse_qs(url.query)
+
+        length = int(self.headers.getheader('Content-Length', 0))
+        data = np.frombuffer(self.rfile.read(length), dtype=np.uint8)
+        img = cv2.imdecode(data, cv2.IMREAD_COLOR) if length > 0 else None
+        if img is None:
+            self._reply(400, {'error': 'Cannot decode the image'})
+            return
+
+        locate_ids = query.get('locate', [''])[0]
+        attr_ids = []
+        if locate_ids != '':
+            if self.server.dweight is None:
+                self._reply(400, {'error': 'Localization not supported without detector weights'})
+                return
+            if locate_ids != 'all':
+                try:
+                    attr_ids = [int(x) for x in locate_ids.split(',')]
+                    if any(not 0 <= a < self.server.db.num_attr for a in attr_ids):
+                        raise ValueError()
+                except ValueError:
+                    self._reply(400, {'error': 'Invalid attribute IDs to locate'})
+                    return
+
+        try:
+            prepped = prep_image(img)
+            attr, heat_maps, score, img_scale, _ = self.server.batcher.submit(prepped, locate_ids != '')
+        except (ResizedImageTooLargeException, ResizedSideTooShortException):
+            self._reply(400, {'error': 'Image size not supported'})
+            return
+        except ServerBusyException:
+            self._reply(503, {'error': 'Server busy'}, {'Retry-After': '1'})
+            return
+        except Exception as e:
+            self._reply_error(e)
+            return
+
+        try:
+            content = {'pred': [int(x) for x in attr]}
+            if locate_ids != '':
+                if locate_ids == 'all':
+                    attr_ids = [i for i in xrange(len(attr)) if attr[i] == 1]
+                content['centroids'] = self._locate(prepped[0], attr_ids, attr, heat_maps, score, img_scale)
+        except Exception as e:
+            self._reply_error(e)
+            return
+        self._reply(200, content)
+
+    def _locate(self, img, attr_ids, attr, heat_maps, score, img_scale):
+        """Locate attributes in a prepared image, returning the (x, y, weight)
+        rows of the centroids of each in the coordinates of the posted image.
+        """
+        server = self.server
+        centroids = {}
+        for a in attr_ids:
+            _, c = locate(img,
+                          server.pos_ave, server.neg_ave, server.dweight,
+                          a,
+                          server.db,
+                          attr, heat_maps, score,
+                          display=False,
+                          index=server.index)
+            c = np.array(c, dtype=float)
+            if len(c) > 0:
+                # back to the coordinates of the posted image
+                c[:, :2] /= img_scale
+            centroids[str(a)] = c.tolist()
+        return centroids
+
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixHTTPServer(_HTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        SocketServer.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def make_server(batcher, db, pos_ave=None, neg_ave=None, dweight=None,
+                port=8080, unix_socket=None, index=None):
+    """Create an HTTP server answering with the results of the batcher.
+    It listens on the Unix socket if given, otherwise on localhost:port.
+    Localization is supported if the detector parameters estimated by
+    estimate_param are given, along with their binding index if any.
+    """
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = _UnixHTTPServer(unix_socket, _Handler)
+    else:
+        server = _HTTPServer(('127.0.0.1', port), _Handler)
+    server.batcher = batcher
+    server.db = db
+    server.pos_ave = pos_ave
+    server.neg_ave = neg_ave
+    server.dweight = dweight
+    server.index = index
+    return server
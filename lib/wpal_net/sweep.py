@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Evaluate many snapshots of a network on an image database, preparing the
+test images only once for all of them.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+from backend import load_weights
+from prefetch import prefetch_images
+from recog import recognize_prepped
+from test import _evaluate
+from utils.timer import Timer
+
+
+def snapshot_order(caffemodel):
+    """Sort key putting snapshots in the order of their iterations."""
+    return [int(x) if x.isdigit() else x for x in re.split(r'(\d+)', os.path.basename(caffemodel))]
+
+
+class PreppedImages(object):
+    """Test images, in batches, prepared once by prep_image and written in
+    their 8-bit form into a file which is memory-mapped for every pass over
+    them.
+    """
+
+    def __init__(self, db, inds, cache_dir=None):
+        self._dir = tempfile.mkdtemp(dir=cache_dir)
+        self._batches = []
+        path = os.path.join(self._dir, 'images.bin')
+
+        # timers
+        _t = {'prep': Timer()}
+
+        offset = 0
+        with open(path, 'wb') as f:
+            _t['prep'].tic()
+            for batch_inds, prepped in prefetch_images(db, inds):
+                batch = []
+                for img, img_scale in prepped:
+                    img = np.ascontiguousarray(img, dtype=np.uint8)
+                    f.write(img.tostring())
+                    batch.append((offset, img.shape, img_scale))
+                    offset += img.size
+                self._batches.append(batch)
+            _t['prep'].toc()
+        print 'Prepared {} images in {:.3f}s'.format(len(inds), _t['prep'].total_time)
+
+        self._mmap = np.memmap(path, dtype=np.uint8, mode='r') if offset > 0 else None
+
+    def __iter__(self):
+        for batch in self._batches:
+            yield [(self._mmap[offset:offset + int(np.prod(shape))].reshape(shape), img_scale)
+                   for offset, shape, img_scale in batch]
+
+    def close(self):
+        self._mmap = None
+        shutil.rmtree(self._dir)
+
+
+def _recognize_batches(net, batches, attr_group, threshold):
+    """Recognize attributes of the images of prepared batches, in their order."""
+    all_attrs = []
+    for prepped in batches:
+        results = recognize_prepped(net, prepped, attr_group, threshold, outputs=('pred',))
+        all_attrs += [x[0] for x in results]
+    return all_attrs
+
+
+def sweep_snapshots(net, prototxt, caffemodels, db, output_dir, backend='caffe', cache_dir=None):
+    """Test snapshots of a network on an image database one after another,
+    loading each into the same net and passing the same prepared images
+    through it. The results of each snapshot are saved in a directory of its
+    name under output_dir, as test_net does.
+    Arguments:
+        net:                network loaded by load_net from prototxt.
+        caffemodels (list): snapshots (caffemodels or weight caches).
+        backend (str):      library the net is run with, see load_net.
+        cache_dir (str):    directory to keep the prepared images in while
+                            testing. Defaults to the temporary directory.
+    Returns:
+        A list holding (mA, Acc, Prec, Rec, F1) of each snapshot.
+    """
+    threshold = np.ones(db.num_attr) * 0.5
+
+    batches = PreppedImages(db, db.test_ind, cache_dir)
+
+    # timers
+    _t = {'recognize_attr': Timer()}
+
+    results = []
+    try:
+        for caffemodel in caffemodels:
+            name = os.path.splitext(os.path.basename(caffemodel.rstrip('/')))[0]
+            print 'Testing {}'.format(name)
+            net = load_weights(net, prototxt, caffemodel, backend)
+
+            _t['recognize_attr'].tic()
+            all_attrs = _recognize_batches(net, batches, db.attr_group, threshold)
+            _t['recognize_attr'].toc()
+            print 'recognize_attr: {:.3f}s per snapshot'.format(_t['recognize_attr'].average_time)
+
+            snapshot_dir = os.path.join(output_dir, name)
+            if not os.path.exists(snapshot_dir):
+                os.makedirs(snapshot_dir)
+            results.append(_evaluate(db, all_attrs, snapshot_dir))
+    finally:
+        batches.close()
+
+    return results
+
+
+def format_sweep(caffemodels, results):
+    """Format the results of sweep_snapshots as a table, one snapshot a row."""
+    names = [os.path.splitext(os.path.basename(x.rstrip('/')))[0] for x in caffemodels]
+    width = max([len(x) for x in names] + [len('snapshot')])
+    lines = ['{:<{}}  {:>7} {:>7} {:>7} {:>7} {:>7}'.format('snapshot', width, 'mA', 'Acc', 'Prec', 'Rec', 'F1')]
+    for name, res in zip(names, results):
+        lines.append('{:<{}}  {:7.4f} {:7.4f} {:7.4f} {:7.4f} {:7.4f}'.format(name, width, *res))
+    best = int(np.argmax([res[0] for res in results]))
+    lines.append('Best mA: {}'.format(names[best]))
+    return '\n'.join(lines)
@@ -26,39 +26,70 @@
 import cPickle
 import math
 import os
+from multiprocessing import Process, Queue
+from Queue import Empty
 
-import cv2
 import numpy as np
+from utils.cpu_budget import set_num_threads, assign_cpus, pin_process, report_cpus
+from utils.feature_store import FeatureWriter
+from utils.shard import shard_range, shard_path
 from utils.timer import Timer
-from recog import recognize_attr
+from backend import load_net
+from prefetch import prefetch_images
+from recog import recognize_prepped, recognize_attr_tta, discretize, warm_up, ALL_OUTPUTS, HEAT_BLOBS
 from wpal_net.config import cfg
 
-def test_net(net, db, output_dir):
-    """Test a Weakly-supervised Pedestrian Attribute Localization Network on an image database."""
 
-    num_images = len(db.test_ind)
+def _recognize_tta(net, imgs, attr_group, threshold, outputs):
+    """Recognize attributes in images one by one with test-time augmentation,
+    returning the results in the form of recognize_prepped without masks.
+    """
+    return [recognize_attr_tta(net, img, attr_group, threshold, outputs=outputs) + (None,) for img in imgs]
+
+
+def _recognize_all(net, db, inds, threshold, writer=None, tta=False):
+    """Recognize attributes of the images of given indexes, in their order.
+    With tta, predictions are averaged over the scales in cfg.TEST.TTA_SCALES,
+    and over flipped images if cfg.TEST.TTA_FLIP is set.
+    """
+    num_images = len(inds)
 
     all_attrs = [[] for _ in xrange(num_images)]
 
     # timers
     _t = {'recognize_attr' : Timer()}
 
-    threshold = np.ones(db.num_attr) * 0.5;
+    # Predictions are stored before being discretized
+    outputs = ('pred',) if writer is None else ALL_OUTPUTS
+    pred_threshold = threshold if writer is None else None
 
     cnt = 0
-    for i in db.test_ind:
-        img_path = db.get_img_path(i)
-        img = cv2.imread(img_path)
+    for batch_inds, prepped in prefetch_images(db, inds, prep=not tta):
         _t['recognize_attr'].tic()
-        attr, _, score, _ = recognize_attr(net, img, db.attr_group, threshold)
+        if tta:
+            results = _recognize_tta(net, [x[0] for x in prepped], db.attr_group, pred_threshold, outputs)
+        else:
+            results = recognize_prepped(net, prepped, db.attr_group, pred_threshold, outputs)
         _t['recognize_attr'].toc()
-        all_attrs[cnt] = attr
-        cnt += 1
+        for i, (attr, heat_maps, score, img_scale, _) in zip(batch_inds, results):
+            if writer is not None:
+                heat_arrays = dict(zip(HEAT_BLOBS, heat_maps))
+                writer.add(i, img_scale, pred=attr, score=score, **heat_arrays)
+                discretize(attr, threshold)
+            all_attrs[cnt] = attr
+            cnt += 1
 
-        if cnt % 100 == 0:
-            print 'recognize_attr: {:d}/{:d} {:.3f}s' \
-                  .format(cnt, num_images, _t['recognize_attr'].average_time)
+            if cnt % 100 == 0:
+                print 'recognize_attr: {:d}/{:d} {:.3f}s per batch' \
+                      .format(cnt, num_images, _t['recognize_attr'].average_time)
 
+    return all_attrs
+
+
+def _evaluate(db, all_attrs, output_dir):
+    """Evaluate recognized attributes of the test images and save the results.
+    Returns mA, Acc, Prec, Rec and F1.
+    """
     attr_file = os.path.join(output_dir, 'attributes.pkl')
     with open(attr_file, 'wb') as f:
         cPickle.dump(all_attrs, f, cPickle.HIGHEST_PROTOCOL)
@@ -77,3 +108,170 @@ def test_net(net, db, output_dir):
             f.write('{}: {}\n'.format(db.attr_eng[i][0][0], accPerAttr[i]))
         f.write('mA: {}\n'.format(mA))
         f.write('Acc: {} \t Prec: {} \t Rec: {} \t F1: {}\n'.format(acc, prec, rec, f1))
+
+    return mA, acc, prec, rec, f1
+
+
+def _shard_inds(db, shard):
+    """Return the test image indexes of a shard, or all of them if shard is None."""
+    if shard is None:
+        return db.test_ind
+    start, end = shard_range(len(db.test_ind), shard)
+    return db.test_ind[start:end]
+
+
+def _finish(db, inds, all_attrs, output_dir, shard):
+    """Evaluate the predictions, or save them as a part to merge if they are of a shard."""
+    if shard is None:
+        _evaluate(db, all_attrs, output_dir)
+        return
+
+    part_file = shard_path(output_dir, 'attributes', shard)
+    with open(part_file, 'wb') as f:
+        cPickle.dump({'inds': inds, 'attrs': all_attrs}, f, cPickle.HIGHEST_PROTOCOL)
+    print 'Predictions of shard {}/{} saved to {}!'.format(shard[0], shard[1], part_file)
+
+
+def test_net(net, db, output_dir, store_dir=None, shard=None, tta=False):
+    """Test a Weakly-supervised Pedestrian Attribute Localization Network on an image database.
+    If store_dir is given, predictions, scores and heat maps of every image are
+    also written into a feature store there.
+    If shard (i, n) is given, only the i-th of n slices of the test images is
+    recognized, and the predictions are saved to be merged by merge_test_shards.
+    If tta is set, predictions are averaged over the scales and flips
+    configured by cfg.TEST.TTA_SCALES and cfg.TEST.TTA_FLIP.
+    """
+    threshold = np.ones(db.num_attr) * 0.5;
+
+    inds = _shard_inds(db, shard)
+
+    writer = FeatureWriter(store_dir) if store_dir is not None else None
+
+    all_attrs = _recognize_all(net, db, inds, threshold, writer, tta)
+
+    if writer is not None:
+        writer.close()
+        print 'Features stored to {}!'.format(store_dir)
+
+    _finish(db, inds, all_attrs, output_dir, shard)
+
+
+def _test_worker(worker_ind, prototxt, caffemodel, db, inds, threshold, cpus, backend, tta, queue):
+    try:
+        pin_process(cpus)
+        if backend == 'caffe':
+            import caffe
+            caffe.set_mode_cpu()
+
+        net = load_net(prototxt, caffemodel, backend)
+        warm_up(net)
+        queue.put((worker_ind, _recognize_all(net, db, inds, threshold, tta=tta)))
+    except Exception as e:
+        queue.put((worker_ind, e))
+
+
+def _gather_parts(workers, queue):
+    """Gather the results put on the queue by test workers, keyed by worker
+    index. An exception sent by a worker is raised, and so is an error if a
+    worker dies without sending anything, after the other workers are
+    terminated.
+    """
+    parts = {}
+    try:
+        while len(parts) < len(workers):
+            try:
+                k, part = queue.get(timeout=1)
+            except Empty:
+                for k, worker in enumerate(workers):
+                    if k not in parts and worker.exitcode not in (None, 0):
+                        raise RuntimeError('Test worker {} died with exit code {}!'.format(k, worker.exitcode))
+                continue
+            if isinstance(part, Exception):
+                raise part
+            parts[k] = part
+    except:
+        for worker in workers:
+            worker.terminate()
+        raise
+    return parts
+
+
+def test_net_parallel(prototxt, caffemodel, db, output_dir, num_workers, num_threads=None, shard=None,
+                      backend='caffe', tta=False):
+    """Test a WPAL Network on an image database using several processes on
+    CPU, each with its own network and a share of the test images.
+    Predictions are gathered in the original order and evaluated once.
+    Arguments:
+        num_workers (int):  number of processes.
+        num_threads (int):  number of CPU cores and BLAS threads of each
+                            process. Defaults to sharing the CPU cores evenly
+                            among processes.
+        shard (tuple):      (i, n) to test only the i-th of n slices, as test_net.
+        backend (str):      library to run the networks with, see load_net.
+        tta (bool):         whether to use test-time augmentation, as test_net.
+    """
+    assignment = assign_cpus(num_workers, num_threads)
+    report_cpus(assignment)
+
+    threshold = np.ones(db.num_attr) * 0.5;
+
+    inds = _shard_inds(db, shard)
+
+    queue = Queue()
+    workers = []
+    for k, worker_inds in enumerate(np.array_split(np.asarray(inds), num_workers)):
+        worker = Process(target=_test_worker,
+                         args=(k, prototxt, caffemodel, db, worker_inds, threshold, assignment[k], backend, tta,
+                               queue))
+        worker.start()
+        workers.append(worker)
+    print 'Started {} workers'.format(num_workers)
+
+    parts = _gather_parts(workers, queue)
+    for worker in workers:
+        worker.join()
+
+    all_attrs = []
+    for k in xrange(num_workers):
+        all_attrs += parts[k]
+
+    _finish(db, inds, all_attrs, output_dir, shard)
+
+
+def merge_test_shards(db, output_dir, num_shards):
+    """Merge predictions saved by the shards of a test run, and evaluate them
+    just as a single run of test_net would.
+    """
+    all_inds = []
+    all_attrs = []
+    for i in xrange(num_shards):
+        part_file = shard_path(output_dir, 'attributes', (i, num_shards))
+        with open(part_file, 'rb') as f:
+            part = cPickle.load(f)
+        all_inds += list(part['inds'])
+        all_attrs += part['attrs']
+
+    if all_inds != list(db.test_ind):
+        raise ValueError('Shards in {} do not cover the test set in order!'.format(output_dir))
+
+    _evaluate(db, all_attrs, output_dir)
+
+
+def test_ensemble(ensemble, db, output_dir):
+    """Test an Ensemble of models of attribute ranges on an image database."""
+    threshold = np.ones(db.num_attr) * 0.5;
+
+    num_images = len(db.test_ind)
+    all_attrs = []
+
+    # timers
+    _t = {'recognize_attr' : Timer()}
+
+    for batch_inds, prepped in prefetch_images(db, db.test_ind):
+        _t['recognize_attr'].tic()
+        all_attrs += ensemble.recognize_prepped(prepped, threshold)
+        _t['recognize_attr'].toc()
+        print 'recognize_attr: {:d}/{:d} {:.3f}s per batch' \
+              .format(len(all_attrs), num_images, _t['recognize_attr'].average_time)
+
+    _evaluate(db, all_attrs, output_dir)
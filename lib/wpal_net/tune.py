@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Tune the number of BLAS threads of a model for testing on the CPU of this
+host, along with the batch size of the server, and keep the best setting in
+a profile next to the model, which the test tools load before Caffe.
+The batch size is kept as TEST.SERVE_BATCH_SIZE only, as batches of images
+of different shapes change the predictions of test_net and estimate_param.
+"""
+
+import os.path as osp
+import socket
+import time
+from multiprocessing import Process, Pipe
+
+import numpy as np
+from utils.cpu_budget import available_cpus, assign_cpus, pin_process
+
+from backend import load_net
+from config import cfg, cfg_from_file
+from recog import recognize_prepped
+
+
+def profile_path(caffemodel):
+    """Return the path of the profile of a model (or a weight cache)."""
+    return osp.splitext(caffemodel.rstrip('/'))[0] + '.profile.yml'
+
+
+def load_profile(caffemodel):
+    """Merge the profile of a model into cfg if there is one.
+    Returns whether a profile was loaded.
+    """
+    path = profile_path(caffemodel)
+    if not osp.exists(path):
+        return False
+    batch_size = cfg.TEST.BATCH_SIZE
+    cfg_from_file(path)
+    print 'Loaded profile {}: {} threads, server batch size {}' \
+          .format(path, cfg.TEST.NUM_THREADS, cfg.TEST.SERVE_BATCH_SIZE)
+    if cfg.TEST.BATCH_SIZE > max(1, batch_size):
+        print 'Warning: profile {} raises TEST.BATCH_SIZE to {}, which makes predictions depend on ' \
+              'the images sharing a batch!'.format(path, cfg.TEST.BATCH_SIZE)
+    return True
+
+
+def _tune_worker(prototxt, caffemodel, backend, num_threads, batch_sizes, prepped, rounds, conn):
+    try:
+        pin_process(assign_cpus(1, num_threads)[0])
+        if backend == 'caffe':
+            import caffe
+            caffe.set_mode_cpu()
+        net = load_net(prototxt, caffemodel, backend)
+
+        for batch_size in batch_sizes:
+            batches = [prepped[i:i + batch_size] for i in xrange(0, len(prepped) - batch_size + 1, batch_size)]
+            if len(batches) == 0:
+                batches = [(prepped * batch_size)[:batch_size]]
+
+            # Allocate memory for every shape before timing
+            for batch in batches:
+                recognize_prepped(net, batch, [], outputs=('pred',))
+
+            latency = []
+            for _ in xrange(rounds):
+                for batch in batches:
+                    t = time.time()
+                    recognize_prepped(net, batch, [], outputs=('pred',))
+                    latency.append(time.time() - t)
+            latency = np.array(latency)
+            conn.send({'threads': num_threads,
+                       'batch_size': batch_size,
+                       'throughput': batch_size * len(latency) / latency.sum(),
+                       'p50': np.percentile(latency, 50) * 1000,
+                       'p99': np.percentile(latency, 99) * 1000})
+    except Exception as e:
+        conn.send(e)
+    conn.send(None)
+    conn.close()
+
+
+def tune(prototxt, caffemodel, prepped, batch_sizes, thread_counts,
+         rounds=3, max_latency=None, backend='caffe'):
+    """Measure the throughput and latency of a model on CPU for every pair of
+    batch size and thread count. Every thread count is measured in a process
+    of its own, pinned to as many cores, since BLAS reads its number of
+    threads only when loaded.
+    Arguments:
+        prepped (list):         (img, img_scale) pairs returned by prep_image,
+                                cut into batches of each batch size.
+        batch_sizes (list):     batch sizes to try.
+        thread_counts (list):   numbers of BLAS threads to try.
+        rounds (int):           number of passes over the images to time.
+        max_latency (float):    max p99 latency of a batch in ms allowed for
+                                the best setting. Defaults to no limit.
+        backend (str):          library to run the network with.
+    Returns:
+        best (dict):    the setting with the highest throughput within the
+                        latency limit, or None if none is within it.
+        results (list): measurements of every setting, as dicts of threads,
+                        batch_size, throughput (images per second) and p50
+                        and p99 (latency of a batch in ms).
+    """
+    results = []
+    for num_threads in thread_counts:
+        conn, child_conn = Pipe()
+        worker = Process(target=_tune_worker,
+                         args=(prototxt, caffemodel, backend, num_threads, batch_sizes,
+                               prepped, rounds, child_conn))
+        worker.start()
+        # Only the worker holds its end, so that its death ends the pipe.
+        child_conn.close()
+        while True:
+            try:
+                res = conn.recv()
+            except EOFError:
+                worker.join()
+                raise RuntimeError('Tuning worker of {} threads died with exit code {}!'
+                                   .format(num_threads, worker.exitcode))
+            if res is None:
+                break
+            if isinstance(res, Exception):
+                worker.join()
+                raise res
+            print '{threads:>3} threads, batch {batch_size:>3}: {throughput:8.2f} img/s, ' \
+                  'p50 {p50:8.1f} ms, p99 {p99:8.1f} ms'.format(**res)
+            results.append(res)
+        worker.join()
+
+    valid = [x for x in results if max_latency is None or x['p99'] <= max_latency]
+    best = max(valid, key=lambda x: x['throughput']) if len(valid) > 0 else None
+    return best, results
+
+
+def save_profile(caffemodel, best, results):
+    """Write the best setting as a cfg file next to the model, with all the
+    measurements in comments.
+    """
+    path = profile_path(caffemodel)
+    with open(path, 'w') as f:
+        f.write('# Tuned for {} on {} with {} CPUs\n'.format(osp.basename(caffemodel.rstrip('/')),
+                                                            socket.gethostname(), len(available_cpus())))
+        f.write('# threads batch_size throughput(img/s) p50(ms) p99(ms)\n')
+        for res in results:
+            f.write('# {threads} {batch_size} {throughput:.2f} {p50:.1f} {p99:.1f}\n'.format(**res))
+        f.write('TEST:\n')
+        f.write('  SERVE_BATCH_SIZE: {}\n'.format(best['batch_size']))
+        f.write('  NUM_THREADS: {}\n'.format(best['threads']))
+    return path
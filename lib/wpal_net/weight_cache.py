@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Cache of the weights of a model in a flat file, memory-mapped when loaded.
+Loading assigns the parameters of a net straight from the mapped file instead
+of parsing a caffemodel, and processes on a host loading the same cache read
+it from the same pages of the page cache.
+"""
+
+import cPickle
+import os
+import os.path as osp
+
+import numpy as np
+
+_WEIGHTS_FILE = 'weights.bin'
+_INDEX_FILE = 'index.pkl'
+
+# Alignment in bytes of each array in the weights file
+_ALIGN = 64
+
+
+def is_weight_cache(path):
+    return osp.isdir(path) and osp.exists(osp.join(path, _INDEX_FILE))
+
+
+def weights_file(path):
+    """Return the file holding the weights of a caffemodel or weight cache."""
+    return osp.join(path, _WEIGHTS_FILE) if is_weight_cache(path) else path
+
+
+def save_weights(net, cache_dir):
+    """Write the parameters of a net into a weight cache."""
+    if not osp.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    index = []
+    offset = 0
+    with open(osp.join(cache_dir, _WEIGHTS_FILE), 'wb') as f:
+        for name, blobs in net.params.iteritems():
+            entries = []
+            for blob in blobs:
+                arr = np.ascontiguousarray(blob.data, dtype=np.float32)
+                f.write('\0' * (-offset % _ALIGN))
+                offset += -offset % _ALIGN
+                f.write(arr.tostring())
+                entries.append((offset, arr.shape))
+                offset += arr.nbytes
+            index.append((name, entries))
+
+    with open(osp.join(cache_dir, _INDEX_FILE), 'wb') as f:
+        cPickle.dump(index, f, cPickle.HIGHEST_PROTOCOL)
+
+
+class WeightCache(object):
+    """Read-only view of the weights in a weight cache."""
+
+    def __init__(self, cache_dir):
+        with open(osp.join(cache_dir, _INDEX_FILE), 'rb') as f:
+            self._index = cPickle.load(f)
+        self._mmap = np.memmap(osp.join(cache_dir, _WEIGHTS_FILE), dtype=np.uint8, mode='r')
+
+    def params(self):
+        """Yield the name and the parameter arrays of each layer."""
+        for name, entries in self._index:
+            arrays = [self._mmap[offset:offset + 4 * int(np.prod(shape))].view(np.float32).reshape(shape)
+                      for offset, shape in entries]
+            yield name, arrays
+
+    def assign(self, net):
+        """Copy the weights into the parameters of a net of the same
+        definition. Layers missing in the net are ignored.
+        """
+        for name, arrays in self.params():
+            if name not in net.params:
+                continue
+            blobs = net.params[name]
+            if len(blobs) != len(arrays) or any(b.data.shape != a.shape for b, a in zip(blobs, arrays)):
+                raise ValueError('Shapes of the parameters of layer {} do not match the weight cache!'
+                                 .format(name))
+            for blob, arr in zip(blobs, arrays):
+                blob.data[...] = arr
@@ -48,3 +48,9 @@ lib_path = osp.join(project_path, 'lib')
 add_path(lib_path)
 
 os.chdir(project_path)
+
+# Report slow imports if asked to
+if os.environ.get('WPAL_IMPORT_TIME'):
+    from utils import import_time
+    num = os.environ['WPAL_IMPORT_TIME']
+    import_time.enable(int(num) if num.isdigit() and int(num) > 1 else 20)
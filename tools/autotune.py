@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Tune the batch size and the number of BLAS threads of a WPAL Network for
+testing on the CPU of this host, and write the best setting into a profile
+next to the model, which test_net.py, estimate_param.py, loc.py and serve.py
+load automatically. The number of threads applies to all of them, and the
+batch size to serve.py only.
+"""
+
+import _init_path
+
+import argparse
+import os
+import pprint
+import sys
+
+import cv2
+import numpy as np
+
+from wpal_net.backend import BACKENDS
+from wpal_net.config import cfg, cfg_from_file, cfg_from_list
+from wpal_net.recog import prep_image
+from wpal_net.tune import tune, save_profile
+from utils.cpu_budget import available_cpus
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='tune batch size and threads of WPAL-network on CPU')
+    parser.add_argument('--def', dest='prototxt',
+                        help='prototxt file defining the network, '
+                             'e.g. the one written by test_net.py for a range of attributes',
+                        default=None, type=str)
+    parser.add_argument('--net', dest='caffemodel',
+                        help='model to tune',
+                        default=None, type=str)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional cfg file', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs',
+                        help='set cfg keys', default=None,
+                        nargs=argparse.REMAINDER)
+    parser.add_argument('--db', dest='db',
+                        help='the name of the database',
+                        default=None, type=str)
+    parser.add_argument('--setid', dest='par_set_id',
+                        help='the index of training and testing data partition set',
+                        default='0', type=int)
+    parser.add_argument('--images', dest='num_images',
+                        help='number of test images to time the network on',
+                        default=64, type=int)
+    parser.add_argument('--batch-sizes', dest='batch_sizes',
+                        help='comma-separated batch sizes to try',
+                        default='1,2,4,8,16,32', type=str)
+    parser.add_argument('--threads', dest='thread_counts',
+                        help='comma-separated numbers of BLAS threads to try '
+                             '(default: powers of 2 up to the number of CPU cores)',
+                        default=None, type=str)
+    parser.add_argument('--rounds', dest='rounds',
+                        help='number of timed passes over the images',
+                        default=3, type=int)
+    parser.add_argument('--max-latency', dest='max_latency',
+                        help='max p99 latency of a batch in ms (default: no limit)',
+                        default=None, type=float)
+    parser.add_argument('--backend', dest='backend',
+                        help='library to run the network with (default: caffe)',
+                        default='caffe', choices=BACKENDS)
+
+    args = parser.parse_args()
+
+    if args.prototxt is None or args.caffemodel is None or args.db is None:
+        parser.print_help()
+        sys.exit()
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+
+    print('Using cfg:')
+    pprint.pprint(cfg)
+
+    if args.db == 'RAP':
+        """Load RAP database"""
+        from utils.rap_db import RAP
+        db = RAP(os.path.join('data', 'dataset', args.db), args.par_set_id)
+    else:
+        """Load PETA dayanse"""
+        from utils.peta_db import PETA
+        db = PETA(os.path.join('data', 'dataset', args.db), args.par_set_id)
+
+    # Caffe is loaded only by the tuning processes, each with its own threads.
+    batch_sizes = [int(x) for x in args.batch_sizes.split(',')]
+    if args.thread_counts is None:
+        num_cores = len(available_cpus())
+        thread_counts = sorted(set([2 ** i for i in xrange(int(np.log2(num_cores)) + 1)] + [num_cores]))
+    else:
+        thread_counts = [int(x) for x in args.thread_counts.split(',')]
+
+    inds = np.random.RandomState(cfg.RNG_SEED).permutation(db.test_ind)[:args.num_images]
+    prepped = [prep_image(cv2.imread(db.get_img_path(i))) for i in inds]
+    print 'Timing on {} test images'.format(len(prepped))
+
+    best, results = tune(args.prototxt, args.caffemodel, prepped, batch_sizes, thread_counts,
+                         args.rounds, args.max_latency, args.backend)
+    if best is None:
+        print 'No setting is within a p99 latency of {} ms!'.format(args.max_latency)
+        sys.exit(1)
+
+    path = save_profile(args.caffemodel, best, results)
+    print 'Best: batch size {batch_size} with {threads} threads, {throughput:.2f} img/s, ' \
+          'p99 {p99:.1f} ms'.format(**best)
+    print 'Wrote profile to {}'.format(path)
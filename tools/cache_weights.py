@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Convert a caffemodel into a weight cache, which tools load faster by
+passing its directory as --net.
+"""
+
+import _init_path
+
+import argparse
+import sys
+import time
+
+from wpal_net.backend import load_net
+from wpal_net.weight_cache import save_weights
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='convert a model of WPAL-network into a weight cache')
+    parser.add_argument('--def', dest='prototxt',
+                        help='prototxt file defining the network',
+                        default=None, type=str)
+    parser.add_argument('--net', dest='caffemodel',
+                        help='model to convert',
+                        default=None, type=str)
+    parser.add_argument('--output', dest='cache_dir',
+                        help='directory to write the weight cache into',
+                        default=None, type=str)
+
+    args = parser.parse_args()
+
+    if args.prototxt is None or args.caffemodel is None or args.cache_dir is None:
+        parser.print_help()
+        sys.exit()
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    import caffe
+    caffe.set_mode_cpu()
+
+    t = time.time()
+    net = load_net(args.prototxt, args.caffemodel)
+    print 'Loaded {} in {:.3f}s'.format(args.caffemodel, time.time() - t)
+
+    save_weights(net, args.cache_dir)
+
+    t = time.time()
+    load_net(args.prototxt, args.cache_dir)
+    print 'Loaded the weight cache {} in {:.3f}s'.format(args.cache_dir, time.time() - t)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Check that a WPAL Network gives the same outputs with the OpenCV backend
+as with pycaffe.
+"""
+
+import _init_path
+
+import argparse
+import os
+import pprint
+import sys
+
+import cv2
+
+from wpal_net.backend import load_net, compare_nets
+from wpal_net.config import cfg, cfg_from_file, cfg_from_list
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='check the OpenCV backend of WPAL-network against pycaffe')
+    parser.add_argument('--def', dest='prototxt',
+                        help='prototxt file defining the network',
+                        default=None, type=str)
+    parser.add_argument('--net', dest='caffemodel',
+                        help='model to check',
+                        default=None, type=str)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional cfg file', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs',
+                        help='set cfg keys', default=None,
+                        nargs=argparse.REMAINDER)
+    parser.add_argument('--db', dest='db',
+                        help='the name of the database',
+                        default=None, type=str)
+    parser.add_argument('--setid', dest='par_set_id',
+                        help='the index of training and testing data partition set',
+                        default='0', type=int)
+    parser.add_argument('--count', dest='count',
+                        help='number of test images to compare outputs on',
+                        default=20, type=int)
+    parser.add_argument('--tol', dest='tol',
+                        help='largest absolute difference of outputs tolerated',
+                        default=1e-3, type=float)
+
+    args = parser.parse_args()
+
+    if args.prototxt is None or args.caffemodel is None or args.db is None:
+        parser.print_help()
+        sys.exit()
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+
+    print('Using cfg:')
+    pprint.pprint(cfg)
+
+    if args.db == 'RAP':
+        """Load RAP database"""
+        from utils.rap_db import RAP
+        db = RAP(os.path.join('data', 'dataset', args.db), args.par_set_id)
+    else:
+        """Load PETA dayanse"""
+        from utils.peta_db import PETA
+        db = PETA(os.path.join('data', 'dataset', args.db), args.par_set_id)
+
+    import caffe
+    caffe.set_mode_cpu()
+    ref_net = load_net(args.prototxt, args.caffemodel, 'caffe')
+    net = load_net(args.prototxt, args.caffemodel, 'opencv')
+
+    imgs = [cv2.imread(db.get_img_path(i)) for i in db.test_ind[:args.count]]
+    diffs = compare_nets(net, ref_net, imgs, db.attr_group)
+
+    passed = True
+    for name in sorted(diffs):
+        print '{}: max abs diff {:g}'.format(name, diffs[name])
+        passed = passed and diffs[name] <= args.tol
+    print 'Passed!' if passed else 'Failed!'
+    sys.exit(0 if passed else 1)
@@ -30,9 +30,13 @@ import sys
 import time
 import numpy as np
 
-import caffe
+from wpal_net.backend import load_net, BACKENDS
 from wpal_net.config import cfg, cfg_from_file, cfg_from_list
 from wpal_net.estimate import estimate_param as ep
+from wpal_net.recog import warm_up
+from wpal_net.test import set_num_threads
+from wpal_net.tune import load_profile
+from utils.shard import parse_shard
 
 
 def parse_args():
@@ -67,8 +71,18 @@ def parse_args():
                         help='the directory to save outputs',
                         default='./output', type=str)
     parser.add_argument('--result', dest='res',
-                        help='the file storing recognition results',
+                        help='the feature store directory (or pickle file) storing recognition results',
                         default=None, type=str)
+    parser.add_argument('--save-res', dest='save_res',
+                        help='store recognition results for later runs',
+                        action='store_true')
+    parser.add_argument('--shard', dest='shard',
+                        help='use only the i-th of n slices of the training images, given as i/n, '
+                             'and save the partial sums for tools/merge_shards.py',
+                        default=None, type=parse_shard)
+    parser.add_argument('--backend', dest='backend',
+                        help='library to run the network with (default: caffe)',
+                        default='caffe', choices=BACKENDS)
 
     args = parser.parse_args()
 
@@ -87,6 +101,7 @@ if __name__ == '__main__':
 
     if args.cfg_file is not None:
         cfg_from_file(args.cfg_file)
+    load_profile(args.caffemodel)
     if args.set_cfgs is not None:
         cfg_from_list(args.set_cfgs)
 
@@ -99,16 +114,26 @@ if __name__ == '__main__':
         print('Waiting for {} to exist...'.format(args.caffemodel))
         time.sleep(10)
 
-    # set up Caffe
-    if args.gpu_id == -1:
-        caffe.set_mode_cpu()
-    else:
-        caffe.set_mode_gpu()
-        caffe.set_device(args.gpu_id)
-
     if args.res is None:
-        net = caffe.Net(args.prototxt, args.caffemodel, caffe.TEST)
+        if args.gpu_id == -1 and cfg.TEST.NUM_THREADS > 0:
+            set_num_threads(cfg.TEST.NUM_THREADS)
+
+        if args.backend == 'caffe':
+            import caffe
+
+            # set up Caffe
+            if args.gpu_id == -1:
+                caffe.set_mode_cpu()
+            else:
+                caffe.set_mode_gpu()
+                caffe.set_device(args.gpu_id)
+        elif args.gpu_id != -1:
+            print 'Only the caffe backend supports GPU!'
+            sys.exit()
+
+        net = load_net(args.prototxt, args.caffemodel, args.backend)
         net.name = os.path.splitext(os.path.basename(args.caffemodel))[0]
+        warm_up(net)
     else:
         net = None
 
@@ -121,7 +146,11 @@ if __name__ == '__main__':
         from utils.peta_db import PETA
         db = PETA(os.path.join('data', 'dataset', args.db), args.par_set_id)
 
-    binding, pos_ave, neg_ave = ep(net, db, args.output_dir, args.res)
+    if args.shard is not None:
+        ep(net, db, args.output_dir, args.res, args.save_res, args.shard)
+        sys.exit()
+
+    binding, pos_ave, neg_ave = ep(net, db, args.output_dir, args.res, args.save_res)
 
     sorted_detector_ind = [[y[0] for y in sorted(enumerate(x), key=lambda x: x[1], reverse=1)] for x in binding]
     low_detector_ind = [np.where(np.array(z) < 10240)[0] for z in sorted_detector_ind]
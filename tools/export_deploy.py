@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Export a compact WPAL Network for deployment: the pixel means are folded
+into the first convolution, batch normalization into the layers before it,
+and layers without effect at test time are removed.
+"""
+
+import _init_path
+
+import argparse
+import collections
+import pprint
+import sys
+
+from wpal_net.config import cfg, cfg_from_file, cfg_from_list
+from wpal_net.net_def import strip_layers, fold_batch_norm, fold_mean
+from wpal_net.recog import HEAT_BLOBS
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='export WPAL-network for deployment')
+    parser.add_argument('--def', dest='prototxt',
+                        help='prototxt file defining the test network',
+                        default=None, type=str)
+    parser.add_argument('--net', dest='caffemodel',
+                        help='model to export',
+                        default=None, type=str)
+    parser.add_argument('--output', dest='output',
+                        help='path of the exported files without extension, '
+                             'to which .prototxt and .caffemodel are appended',
+                        default=None, type=str)
+    parser.add_argument('--keep-mean', dest='keep_mean',
+                        help='do not fold the pixel means into the network',
+                        action='store_true')
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional cfg file', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs',
+                        help='set cfg keys', default=None,
+                        nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+
+    if args.prototxt is None or args.caffemodel is None or args.output is None:
+        parser.print_help()
+        sys.exit()
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+
+    print('Using cfg:')
+    pprint.pprint(cfg)
+
+    import caffe
+    from caffe.proto import caffe_pb2
+    from google.protobuf import text_format
+    caffe.set_mode_cpu()
+
+    n = caffe_pb2.NetParameter()
+    text_format.Merge(open(args.prototxt).read(), n)
+    net = caffe.Net(args.prototxt, args.caffemodel, caffe.TEST)
+    params = collections.OrderedDict((name, [x.data.copy() for x in blobs])
+                                     for name, blobs in net.params.iteritems())
+
+    outputs = [x for x in ['pred', 'score'] + HEAT_BLOBS if x in net.blobs]
+    deploy = strip_layers(n, outputs)
+    deploy = fold_batch_norm(deploy, params)
+    if not args.keep_mean:
+        deploy = fold_mean(deploy, params, cfg.PIXEL_MEANS.ravel())
+    print 'Layers: {} -> {}'.format(len(n.layer), len(deploy.layer))
+
+    deploy_file = args.output + '.prototxt'
+    with open(deploy_file, 'w') as f:
+        f.write(unicode(text_format.MessageToString(deploy)))
+
+    deploy_net = caffe.Net(deploy_file, caffe.TEST)
+    for name, blobs in deploy_net.params.iteritems():
+        for blob, data in zip(blobs, params[name]):
+            blob.data[...] = data
+    deploy_net.save(args.output + '.caffemodel')
+
+    print 'Exported to {}.prototxt and {}.caffemodel!'.format(args.output, args.output)
+    if not args.keep_mean:
+        print 'Test the exported model with --set TEST.RAW_INPUT True.'
@@ -31,9 +31,14 @@ import sys
 import time
 import numpy as np
 
-import caffe
+from wpal_net.backend import load_net, BACKENDS
 from wpal_net.config import cfg, cfg_from_file, cfg_from_list
 from wpal_net.loc import test_localization, locate_in_video
+from wpal_net.recog import warm_up
+from wpal_net.test import set_num_threads
+from wpal_net.tune import load_profile
+from wpal_net.cache import ForwardCache
+from utils.feature_store import FeatureStore
 
 
 def parse_args():
@@ -91,6 +96,17 @@ def parse_args():
                              'pedestrian tracking should be performed in advance, '
                              'and results are input as an input file.',
                         default=None, type=str)
+    parser.add_argument('--cache-mb', dest='cache_mb',
+                        help='size limit in MB of the cache of network outputs, '
+                             'reused when the same images are localized for several attributes. '
+                             '0 to disable.',
+                        default=0, type=int)
+    parser.add_argument('--store', dest='store_dir',
+                        help='feature store written by test_net.py, to read network outputs from',
+                        default=None, type=str)
+    parser.add_argument('--backend', dest='backend',
+                        help='library to run the network with (default: caffe)',
+                        default='caffe', choices=BACKENDS)
 
     args = parser.parse_args()
 
@@ -109,6 +125,7 @@ if __name__ == '__main__':
 
     if args.cfg_file is not None:
         cfg_from_file(args.cfg_file)
+    load_profile(args.caffemodel)
     if args.set_cfgs is not None:
         cfg_from_list(args.set_cfgs)
 
@@ -135,15 +152,28 @@ if __name__ == '__main__':
     f = open(args.dweight, 'rb')
     pack = cPickle.load(f)
 
-    # set up Caffe
-    if args.gpu_id == -1:
-        caffe.set_mode_cpu()
-    else:
-        caffe.set_mode_gpu()
-        caffe.set_device(args.gpu_id)
+    if args.gpu_id == -1 and cfg.TEST.NUM_THREADS > 0:
+        set_num_threads(cfg.TEST.NUM_THREADS)
+
+    if args.backend == 'caffe':
+        import caffe
+
+        # set up Caffe
+        if args.gpu_id == -1:
+            caffe.set_mode_cpu()
+        else:
+            caffe.set_mode_gpu()
+            caffe.set_device(args.gpu_id)
+    elif args.gpu_id != -1:
+        print 'Only the caffe backend supports GPU!'
+        sys.exit()
 
-    net = caffe.Net(args.prototxt, args.caffemodel, caffe.TEST)
+    net = load_net(args.prototxt, args.caffemodel, args.backend)
     net.name = os.path.splitext(os.path.basename(args.caffemodel))[0]
+    warm_up(net)
+
+    cache = ForwardCache(args.caffemodel, args.cache_mb * 1048576) if args.cache_mb > 0 else None
+    store = FeatureStore(args.store_dir) if args.store_dir is not None else None
 
     if args.video is not None:
         locate_in_video(net,
@@ -151,21 +181,34 @@ if __name__ == '__main__':
                         args.video, args.tracking_res,
                         args.output_dir,
                         pack['pos_ave'], pack['neg_ave'], pack['binding'],
-                        args.attr_id_list)
+                        args.attr_id_list,
+                        index=pack.get('index'))
     else:
         if args.attr_id_list == '-2':
             for a in xrange(db.num_attr):
                 test_localization(net, db, args.output_dir, pack['pos_ave'], pack['neg_ave'], pack['binding'],
                                   attr_id=a,
                                   display=args.display,
-                                  max_count=args.max_count)
+                                  max_count=args.max_count,
+                                  cache=cache,
+                                  store=store,
+                                  index=pack.get('index'))
             test_localization(net, db, args.output_dir, pack['pos_ave'], pack['neg_ave'], pack['binding'],
                               attr_id=-1,
                               display=args.display,
-                              max_count=args.max_count)
+                              max_count=args.max_count,
+                              cache=cache,
+                              store=store,
+                              index=pack.get('index'))
         else:
             for attr_id in args.attr_id_list.split(','):
                 test_localization(net, db, args.output_dir, pack['pos_ave'], pack['neg_ave'], pack['binding'],
                                   attr_id=int(attr_id),
                                   display=args.display,
-                                  max_count=args.max_count)
+                                  max_count=args.max_count,
+                                  cache=cache,
+                                  store=store,
+                                  index=pack.get('index'))
+
+    if cache is not None:
+        print cache.stats()
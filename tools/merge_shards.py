@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Merge partial results of runs of test_net.py or estimate_param.py with --shard."""
+
+import _init_path
+
+import argparse
+import os
+import sys
+
+from wpal_net.estimate import merge_estimate_shards
+from wpal_net.test import merge_test_shards
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='merge results of sharded runs of WPAL-network')
+    parser.add_argument('--mode', dest='mode',
+                        help='merge shards of test_net.py (test) or estimate_param.py (estimate)',
+                        default='test', choices=['test', 'estimate'])
+    parser.add_argument('--shards', dest='shards',
+                        help='number of shards the run was split into',
+                        default=None, type=int)
+    parser.add_argument('--start', dest='start',
+                        help='Attribute index (test mode)',
+                        default=0, type=int)
+    parser.add_argument('--end', dest='end',
+                        help='Attribute index (test mode)',
+                        default=92, type=int)
+    parser.add_argument('--db', dest='db',
+                        help='the name of the database',
+                        default=None, type=str)
+    parser.add_argument('--setid', dest='par_set_id',
+                        help='the index of training and testing data partition set',
+                        default='0', type=int)
+    parser.add_argument('--outputdir', dest='output_dir',
+                        help='the directory the shards saved outputs to',
+                        default='./output', type=str)
+
+    args = parser.parse_args()
+
+    if args.shards is None or args.db is None:
+        parser.print_help()
+        sys.exit()
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.db == 'RAP':
+        """Load RAP database"""
+        from utils.rap_db import RAP
+        db = RAP(os.path.join('data', 'dataset', args.db), args.par_set_id)
+    else:
+        """Load PETA dayanse"""
+        from utils.peta_db import PETA
+        db = PETA(os.path.join('data', 'dataset', args.db), args.par_set_id)
+
+    if args.mode == 'test':
+        db.label_weight = db.label_weight[args.start:args.end]
+        db.labels = db.labels[:, args.start:args.end]
+        db.num_attr = args.end - args.start
+        merge_test_shards(db, args.output_dir + "/attr{}_{}".format(args.start, args.end), args.shards)
+    else:
+        merge_estimate_shards(db, args.output_dir, args.shards)
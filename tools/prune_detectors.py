@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Prune the detectors of a WPAL Network least bound to any attribute,
+according to the binding estimated by estimate_param.py.
+"""
+
+import _init_path
+
+import argparse
+import collections
+import cPickle
+import pprint
+import sys
+
+import yaml
+
+from wpal_net.config import cfg, cfg_from_file, cfg_from_list
+from wpal_net.loc import binding_index
+from wpal_net.prune import select_detectors, kept_bins, prune_net
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='prune detectors of WPAL-network')
+    parser.add_argument('--def', dest='prototxt',
+                        help='prototxt file defining the test network',
+                        default=None, type=str)
+    parser.add_argument('--net', dest='caffemodel',
+                        help='model to prune',
+                        default=None, type=str)
+    parser.add_argument('--detector-weight', dest='dweight',
+                        help='the cPickle file storing the weights of detectors',
+                        default=None, type=str)
+    parser.add_argument('--keep', dest='keep',
+                        help='ratio of detectors to keep in each layer',
+                        default=0.5, type=float)
+    parser.add_argument('--output', dest='output',
+                        help='path of the pruned files without extension, to which '
+                             '.prototxt, .caffemodel, .yml and _detector.pkl are appended',
+                        default=None, type=str)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='cfg file with the layout of the localization layers', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs',
+                        help='set cfg keys', default=None,
+                        nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+
+    if args.prototxt is None or args.caffemodel is None or args.dweight is None \
+            or args.output is None or args.cfg_file is None:
+        parser.print_help()
+        sys.exit()
+
+    return args
+
+
+def _plain(x):
+    """Convert cfg values into plain types for yaml."""
+    if isinstance(x, dict):
+        return dict((k, _plain(v)) for k, v in x.iteritems())
+    if isinstance(x, (list, tuple)):
+        return [_plain(v) for v in x]
+    return x
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+
+    print('Using cfg:')
+    pprint.pprint(cfg)
+
+    with open(args.dweight, 'rb') as f:
+        pack = cPickle.load(f)
+
+    keeps = select_detectors(pack['binding'], cfg.LOC.LAYERS, args.keep)
+    for layer, keep in zip(cfg.LOC.LAYERS, keeps):
+        print '{}: keeping {}/{} detectors'.format(layer.NAME, len(keep), layer.NUM_DETECTOR)
+
+    import caffe
+    from caffe.proto import caffe_pb2
+    from google.protobuf import text_format
+    caffe.set_mode_cpu()
+
+    n = caffe_pb2.NetParameter()
+    text_format.Merge(open(args.prototxt).read(), n)
+    net = caffe.Net(args.prototxt, args.caffemodel, caffe.TEST)
+    params = collections.OrderedDict((name, [x.data.copy() for x in blobs])
+                                     for name, blobs in net.params.iteritems())
+
+    pruned = prune_net(n, params, cfg.LOC.LAYERS, keeps)
+
+    pruned_file = args.output + '.prototxt'
+    with open(pruned_file, 'w') as f:
+        f.write(unicode(text_format.MessageToString(pruned)))
+
+    pruned_net = caffe.Net(pruned_file, caffe.TEST)
+    for name, blobs in pruned_net.params.iteritems():
+        for blob, data in zip(blobs, params[name]):
+            blob.data[...] = data
+    pruned_net.save(args.output + '.caffemodel')
+
+    # Keep the binding of the remaining bins only, and index it anew.
+    bins = kept_bins(cfg.LOC.LAYERS, keeps)
+    pruned_pack = dict((k, pack[k][:, bins]) for k in ('pos_ave', 'neg_ave', 'binding'))
+    pruned_pack['index'] = binding_index(pruned_pack['pos_ave'], pruned_pack['neg_ave'], pruned_pack['binding'])
+    with open(args.output + '_detector.pkl', 'wb') as f:
+        cPickle.dump(pruned_pack, f, cPickle.HIGHEST_PROTOCOL)
+
+    loc_layers = _plain(cfg.LOC.LAYERS)
+    for layer, keep in zip(loc_layers, keeps):
+        layer['NUM_DETECTOR'] = len(keep)
+    with open(args.output + '.yml', 'w') as f:
+        yaml.safe_dump({'SPP': bool(cfg.SPP), 'LOC': {'LAYERS': loc_layers}}, f)
+
+    print 'Pruned model saved to {}.prototxt and {}.caffemodel!'.format(args.output, args.output)
+    print 'Test it with --cfg {}.yml and --detector-weight {}_detector.pkl.'.format(args.output, args.output)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Serve attribute recognition (and localization) of a WPAL Network."""
+
+import _init_path
+
+import argparse
+import cPickle
+import os
+import pprint
+import sys
+
+import numpy as np
+
+from wpal_net.backend import load_net, BACKENDS
+from wpal_net.config import cfg, cfg_from_file, cfg_from_list
+from wpal_net.recog import warm_up
+from wpal_net.test import set_num_threads
+from wpal_net.tune import load_profile
+from wpal_net.server import MicroBatcher, make_server
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='serve WPAL-network')
+    parser.add_argument('--gpu', dest='gpu_id',
+                        help='GPU device ID to use (default: -1)',
+                        default=-1, type=int)
+    parser.add_argument('--def', dest='prototxt',
+                        help='prototxt file defining the network',
+                        default=None, type=str)
+    parser.add_argument('--net', dest='caffemodel',
+                        help='model to serve',
+                        default=None, type=str)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional cfg file', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs',
+                        help='set cfg keys', default=None,
+                        nargs=argparse.REMAINDER)
+    parser.add_argument('--db', dest='db',
+                        help='the name of the database',
+                        default=None, type=str)
+    parser.add_argument('--setid', dest='par_set_id',
+                        help='the index of training and testing data partition set',
+                        default='0', type=int)
+    parser.add_argument('--detector-weight', dest='dweight',
+                        help='the cPickle file storing the weights of detectors, '
+                             'needed for localization',
+                        default=None, type=str)
+    parser.add_argument('--port', dest='port',
+                        help='port to listen on at localhost',
+                        default=8080, type=int)
+    parser.add_argument('--socket', dest='unix_socket',
+                        help='Unix socket to listen on instead of a port',
+                        default=None, type=str)
+    parser.add_argument('--max-batch', dest='max_batch',
+                        help='max number of images in a batch (default: cfg.TEST.SERVE_BATCH_SIZE)',
+                        default=None, type=int)
+    parser.add_argument('--max-wait', dest='max_wait',
+                        help='max time in ms to wait for a batch to fill up',
+                        default=10, type=float)
+    parser.add_argument('--max-queue', dest='max_queue',
+                        help='max number of images waiting for a batch, '
+                             'beyond which requests are refused',
+                        default=256, type=int)
+    parser.add_argument('--backend', dest='backend',
+                        help='library to run the network with (default: caffe)',
+                        default='caffe', choices=BACKENDS)
+
+    args = parser.parse_args()
+
+    if args.prototxt is None or args.caffemodel is None or args.db is None:
+        parser.print_help()
+        sys.exit()
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    load_profile(args.caffemodel)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+
+    cfg.GPU_ID = args.gpu_id
+
+    print('Using cfg:')
+    pprint.pprint(cfg)
+
+    if args.db == 'RAP':
+        """Load RAP database"""
+        from utils.rap_db import RAP
+        db = RAP(os.path.join('data', 'dataset', args.db), args.par_set_id)
+    else:
+        """Load PETA dayanse"""
+        from utils.peta_db import PETA
+        db = PETA(os.path.join('data', 'dataset', args.db), args.par_set_id)
+
+    pack = {'pos_ave': None, 'neg_ave': None, 'binding': None}
+    if args.dweight is not None:
+        with open(args.dweight, 'rb') as f:
+            pack = cPickle.load(f)
+
+    if args.gpu_id == -1 and cfg.TEST.NUM_THREADS > 0:
+        set_num_threads(cfg.TEST.NUM_THREADS)
+
+    if args.backend == 'caffe':
+        import caffe
+
+        # set up Caffe
+        if args.gpu_id == -1:
+            caffe.set_mode_cpu()
+        else:
+            caffe.set_mode_gpu()
+            caffe.set_device(args.gpu_id)
+    elif args.gpu_id != -1:
+        print 'Only the caffe backend supports GPU!'
+        sys.exit()
+
+    if args.max_batch is None:
+        args.max_batch = cfg.TEST.SERVE_BATCH_SIZE
+
+    net = load_net(args.prototxt, args.caffemodel, args.backend)
+    net.name = os.path.splitext(os.path.basename(args.caffemodel))[0]
+    warm_up(net, sorted(set([1, args.max_batch])))
+
+    batcher = MicroBatcher(net, db.attr_group, np.ones(db.num_attr) * 0.5,
+                           max_batch=args.max_batch,
+                           max_wait=args.max_wait / 1000.0,
+                           max_queue=args.max_queue,
+                           gpu_id=args.gpu_id)
+    server = make_server(batcher, db, pack['pos_ave'], pack['neg_ave'], pack['binding'],
+                         port=args.port, unix_socket=args.unix_socket, index=pack.get('index'))
+
+    print 'Serving on {}...'.format(args.unix_socket if args.unix_socket is not None
+                                    else 'localhost:{}'.format(args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Test many snapshots of a WPAL Network, e.g. to pick the best one of a
+training run, decoding and preparing the test images only once.
+"""
+
+import _init_path
+
+import argparse
+import glob
+import os
+import pprint
+import sys
+
+from wpal_net.backend import load_net, range_prototxt, BACKENDS
+from wpal_net.config import cfg, cfg_from_file, cfg_from_list
+from wpal_net.recog import warm_up
+from wpal_net.sweep import sweep_snapshots, snapshot_order, format_sweep
+from wpal_net.test import set_num_threads
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='test snapshots of WPAL-network')
+    parser.add_argument('--gpu', dest='gpu_id',
+                        help='GPU device ID to use (default: -1)',
+                        default=-1, type=int)
+    parser.add_argument('--def', dest='prototxt',
+                        help='prototxt file defining the network',
+                        default=None, type=str)
+    parser.add_argument('--nets', dest='caffemodels',
+                        help='snapshots to test, as paths or quoted glob patterns',
+                        default=None, nargs='+', type=str)
+    parser.add_argument('--start', dest='start',
+                        help='Attribute index',
+                        default=0, type=int)
+    parser.add_argument('--end', dest='end',
+                        help='Attribute index',
+                        default=92, type=int)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional cfg file', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs',
+                        help='set cfg keys', default=None,
+                        nargs=argparse.REMAINDER)
+    parser.add_argument('--db', dest='db',
+                        help='the name of the database',
+                        default=None, type=str)
+    parser.add_argument('--setid', dest='par_set_id',
+                        help='the index of training and testing data partition set',
+                        default='0', type=int)
+    parser.add_argument('--outputdir', dest='output_dir',
+                        help='the directory to save outputs',
+                        default='./output', type=str)
+    parser.add_argument('--cache', dest='cache_dir',
+                        help='directory to keep the prepared test images in while testing '
+                             '(default: the temporary directory)',
+                        default=None, type=str)
+    parser.add_argument('--backend', dest='backend',
+                        help='library to run the network with (default: caffe)',
+                        default='caffe', choices=BACKENDS)
+
+    args = parser.parse_args()
+
+    if args.prototxt is None or args.caffemodels is None or args.db is None:
+        parser.print_help()
+        sys.exit()
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+
+    cfg.GPU_ID = args.gpu_id
+
+    print('Using cfg:')
+    pprint.pprint(cfg)
+
+    caffemodels = []
+    for pattern in args.caffemodels:
+        caffemodels += sorted(glob.glob(pattern), key=snapshot_order) if glob.has_magic(pattern) else [pattern]
+    if len(caffemodels) == 0:
+        print 'No snapshot matches {}!'.format(' '.join(args.caffemodels))
+        sys.exit(1)
+    print 'Testing {} snapshots'.format(len(caffemodels))
+
+    if args.gpu_id == -1 and cfg.TEST.NUM_THREADS > 0:
+        set_num_threads(cfg.TEST.NUM_THREADS)
+
+    if args.backend == 'caffe':
+        import caffe
+
+        # set up Caffe
+        if args.gpu_id == -1:
+            caffe.set_mode_cpu()
+        else:
+            caffe.set_mode_gpu()
+            caffe.set_device(args.gpu_id)
+    elif args.gpu_id != -1:
+        print 'Only the caffe backend supports GPU!'
+        sys.exit()
+
+    start = args.start
+    end = args.end
+
+    prototxt = range_prototxt(args.prototxt, start, end)
+    net = load_net(prototxt, caffemodels[0], args.backend)
+    warm_up(net)
+
+    if args.db == 'RAP':
+        """Load RAP database"""
+        from utils.rap_db import RAP
+        db = RAP(os.path.join('data', 'dataset', args.db), args.par_set_id)
+    else:
+        """Load PETA dayanse"""
+        from utils.peta_db import PETA
+        db = PETA(os.path.join('data', 'dataset', args.db), args.par_set_id)
+
+    db.label_weight = db.label_weight[start:end]
+    db.labels = db.labels[:, start:end]
+    db.num_attr = end - start
+
+    output_dir = os.path.join(args.output_dir, 'attr{}_{}'.format(start, end))
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    results = sweep_snapshots(net, prototxt, caffemodels, db, output_dir, args.backend, args.cache_dir)
+
+    table = format_sweep(caffemodels, results)
+    print table
+    with open(os.path.join(output_dir, 'sweep.txt'), 'w') as f:
+        f.write(table + '\n')
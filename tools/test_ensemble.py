@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+# --------------------------------------------------------------------
+# This file is part of
+# Weakly-supervised Pedestrian Attribute Localization Network.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Weakly-supervised Pedestrian Attribute Localization Network
+# is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Weakly-supervised Pedestrian Attribute Localization Network.
+# If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------
+
+"""Test an ensemble of WPAL Networks trained on ranges of attributes."""
+
+import _init_path
+
+import argparse
+import os
+import pprint
+import sys
+
+from wpal_net.backend import range_prototxt, BACKENDS
+from wpal_net.config import cfg, cfg_from_file, cfg_from_list
+from wpal_net.ensemble import Ensemble
+from wpal_net.test import test_ensemble, set_num_threads
+from utils.cpu_budget import available_cpus
+
+
+def parse_args():
+    """
+    Parse input arguments
+    """
+    parser = argparse.ArgumentParser(description='test an ensemble of WPAL-networks')
+    parser.add_argument('--gpus', dest='gpu_ids',
+                        help='comma separated GPU device IDs to spread the models over '
+                             '(default: CPU only)',
+                        default=None, type=str)
+    parser.add_argument('--def', dest='prototxt',
+                        help='prototxt file defining the network, rewritten for every attribute range',
+                        default=None, type=str)
+    parser.add_argument('--models', dest='models',
+                        help='text file listing a model in each line as "start end caffemodel", '
+                             'optionally followed by a prototxt to use instead of --def',
+                        default=None, type=str)
+    parser.add_argument('--threads', dest='threads',
+                        help='number of BLAS threads of each model '
+                             '(default: CPU cores shared evenly among models)',
+                        default=None, type=int)
+    parser.add_argument('--backend', dest='backend',
+                        help='library to run the networks with (default: caffe)',
+                        default='caffe', choices=BACKENDS)
+    parser.add_argument('--cfg', dest='cfg_file',
+                        help='optional cfg file', default=None, type=str)
+    parser.add_argument('--set', dest='set_cfgs',
+                        help='set cfg keys', default=None,
+                        nargs=argparse.REMAINDER)
+    parser.add_argument('--db', dest='db',
+                        help='the name of the database',
+                        default=None, type=str)
+    parser.add_argument('--setid', dest='par_set_id',
+                        help='the index of training and testing data partition set',
+                        default='0', type=int)
+    parser.add_argument('--outputdir', dest='output_dir',
+                        help='the directory to save outputs',
+                        default='./output', type=str)
+
+    args = parser.parse_args()
+
+    if args.models is None or args.db is None:
+        parser.print_help()
+        sys.exit()
+
+    return args
+
+
+def load_models(models_file):
+    """Read the list of models of attribute ranges. The prototxt of a model
+    is None if it is to be rewritten from --def.
+    """
+    models = []
+    for line in open(models_file):
+        fields = line.split()
+        if len(fields) == 0 or fields[0].startswith('#'):
+            continue
+        models.append((int(fields[0]), int(fields[1]),
+                       fields[3] if len(fields) > 3 else None,
+                       fields[2]))
+    return models
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print('Called with args:')
+    print(args)
+
+    if args.cfg_file is not None:
+        cfg_from_file(args.cfg_file)
+    if args.set_cfgs is not None:
+        cfg_from_list(args.set_cfgs)
+
+    print('Using cfg:')
+    pprint.pprint(cfg)
+
+    models = load_models(args.models)
+
+    # Limit BLAS threads before Caffe is loaded, for workers to inherit.
+    if args.threads is None:
+        args.threads = max(1, len(available_cpus()) / len(models))
+    set_num_threads(args.threads)
+
+    models = [(start, end, net_file if net_file is not None else range_prototxt(args.prototxt, start, end), model)
+              for start, end, net_file, model in models]
+
+    if args.db == 'RAP':
+        """Load RAP database"""
+        from utils.rap_db import RAP
+        db = RAP(os.path.join('data', 'dataset', args.db), args.par_set_id)
+    else:
+        """Load PETA dayanse"""
+        from utils.peta_db import PETA
+        db = PETA(os.path.join('data', 'dataset', args.db), args.par_set_id)
+
+    gpu_ids = [int(x) for x in args.gpu_ids.split(',')] if args.gpu_ids is not None else None
+    ensemble = Ensemble(models, db.num_attr, db.attr_group, gpu_ids, args.threads, args.backend)
+
+    output_dir = os.path.join(args.output_dir, 'ensemble')
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    try:
+        test_ensemble(ensemble, db, output_dir)
+    finally:
+        ensemble.close()
@@ -29,11 +29,13 @@ import pprint
 import sys
 import time
 
-import caffe
 from wpal_net.config import cfg, cfg_from_file, cfg_from_list
-from wpal_net.test import test_net
-from caffe.proto import caffe_pb2
-from google.protobuf import text_format
+from wpal_net.test import test_net, test_net_parallel, set_num_threads
+from wpal_net.recog import warm_up
+from wpal_net.tune import load_profile
+from wpal_net.backend import load_net, range_prototxt, BACKENDS
+from utils.cpu_budget import available_cpus
+from utils.shard import parse_shard
 
 def parse_args():
     """
@@ -72,6 +74,27 @@ def parse_args():
     parser.add_argument('--outputdir', dest='output_dir',
                         help='the directory to save outputs',
                         default='./output', type=str)
+    parser.add_argument('--store', dest='store_dir',
+                        help='directory to store predictions, scores and heat maps into',
+                        default=None, type=str)
+    parser.add_argument('--workers', dest='workers',
+                        help='number of processes to test with on CPU, each with its own network',
+                        default=1, type=int)
+    parser.add_argument('--threads', dest='threads',
+                        help='number of BLAS threads of each worker process '
+                             '(default: CPU cores shared evenly among workers)',
+                        default=None, type=int)
+    parser.add_argument('--shard', dest='shard',
+                        help='test only the i-th of n slices of the test images, given as i/n, '
+                             'and save the predictions for tools/merge_shards.py',
+                        default=None, type=parse_shard)
+    parser.add_argument('--backend', dest='backend',
+                        help='library to run the network with (default: caffe)',
+                        default='caffe', choices=BACKENDS)
+    parser.add_argument('--tta', dest='tta',
+                        help='average predictions over the scales in cfg.TEST.TTA_SCALES '
+                             'and over flipped images if cfg.TEST.TTA_FLIP is set',
+                        action='store_true')
 
     args = parser.parse_args()
 
@@ -90,6 +113,7 @@ if __name__ == '__main__':
 
     if args.cfg_file is not None:
         cfg_from_file(args.cfg_file)
+    load_profile(args.caffemodel)
     if args.set_cfgs is not None:
         cfg_from_list(args.set_cfgs)
 
@@ -102,36 +126,44 @@ if __name__ == '__main__':
         print('Waiting for {} to exist...'.format(args.caffemodel))
         time.sleep(10)
 
-    # set up Caffe
-    if args.gpu_id == -1:
-        caffe.set_mode_cpu()
-    else:
-        caffe.set_mode_gpu()
-        caffe.set_device(args.gpu_id)
+    if args.workers > 1:
+        if args.gpu_id != -1 or args.store_dir is not None:
+            print 'Testing with multiple workers supports neither GPU nor --store!'
+            sys.exit()
+        # Limit BLAS threads before Caffe is loaded, for workers to inherit.
+        if args.threads is None:
+            args.threads = max(1, len(available_cpus()) / args.workers)
+        set_num_threads(args.threads)
+    elif args.threads is not None:
+        set_num_threads(args.threads)
+    elif args.gpu_id == -1 and cfg.TEST.NUM_THREADS > 0:
+        set_num_threads(cfg.TEST.NUM_THREADS)
+
+    if args.backend == 'caffe':
+        import caffe
+
+        # set up Caffe
+        if args.gpu_id == -1:
+            caffe.set_mode_cpu()
+        else:
+            caffe.set_mode_gpu()
+            caffe.set_device(args.gpu_id)
+    elif args.gpu_id != -1:
+        print 'Only the caffe backend supports GPU!'
+        sys.exit()
 
 
     start=args.start
     end=args.end
     num_attr=end-start
 
-
-    net_file=args.prototxt
-    n=caffe_pb2.NetParameter()
-    text_format.Merge(open(net_file).read(), n)
-    n.layer[-6].inner_product_param.num_output=num_attr
-
-    new_dir=os.path.dirname(net_file)+"/train_net_dir"
-    new_file=  new_dir+"/test_net_{}_{}.prototxt".format(start,end)
-
-    with open(new_file,'w+') as  new_prototxt_file:
-        new_prototxt_file.write(unicode(text_format.MessageToString(n)))
-
+    new_file = range_prototxt(args.prototxt, start, end)
     args.prototxt=new_file
-    # print args.prototxt
-    # print num_attr
-    # time.sleep(10)
-    net = caffe.Net(new_file, args.caffemodel, caffe.TEST)
-    net.name = os.path.splitext(os.path.basename(args.caffemodel))[0]
+
+    if args.workers == 1:
+        net = load_net(new_file, args.caffemodel, args.backend)
+        net.name = os.path.splitext(os.path.basename(args.caffemodel))[0]
+        warm_up(net)
 
     if args.db == 'RAP':
         """Load RAP database"""
@@ -153,4 +185,11 @@ if __name__ == '__main__':
         pass
 
 
-    test_net(net, db, args.output_dir)
+    if args.shard is not None and args.store_dir is not None:
+        args.store_dir += '_shard{}of{}'.format(args.shard[0], args.shard[1])
+
+    if args.workers > 1:
+        test_net_parallel(new_file, args.caffemodel, db, args.output_dir, args.workers, args.threads,
+                          args.shard, args.backend, args.tta)
+    else:
+        test_net(net, db, args.output_dir, args.store_dir, args.shard, args.tta)
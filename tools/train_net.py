@@ -27,12 +27,7 @@ import argparse
 import os
 import sys
 
-import caffe
 from wpal_net.config import cfg, cfg_from_file, cfg_from_list
-from wpal_net.train import train_net
-
-from caffe.proto import caffe_pb2
-from google.protobuf import text_format
 
 def parse_args():
     """
@@ -100,6 +95,11 @@ if __name__ == '__main__':
 
     cfg.GPU_ID = args.gpu_id
 
+    import caffe
+    from caffe.proto import caffe_pb2
+    from google.protobuf import text_format
+    from wpal_net.train import train_net
+
     # set up Caffe
     if args.gpu_id == -1:
         caffe.set_mode_cpu()